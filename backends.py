@@ -0,0 +1,158 @@
+# backends.py
+"""
+Backends de entrada/saída compartilhados pelos controladores (e replays).
+
+O estado dos botões é entregue como um inteiro bitmask (bit b = botão b) por
+amostra e os eixos como uma lista de floats, lida de uma vez. Bordas de subida
+e descida saem de um XOR/AND e só os bits ligados são percorridos, então o
+custo por tick acompanha o número de mudanças e não o número de entradas.
+
+Para jogos que aceitam gamepad, UInputGamepad cria um gamepad virtual
+(uinput, Linux) e repassa a posição analógica dos eixos a cada amostra.
+"""
+import pygame
+
+# Eixos do gamepad virtual (nome no perfil -> código evdev)
+GAMEPAD_AXES = {
+    'x': 'ABS_X', 'y': 'ABS_Y', 'z': 'ABS_Z',
+    'rx': 'ABS_RX', 'ry': 'ABS_RY', 'rz': 'ABS_RZ',
+    'throttle': 'ABS_THROTTLE', 'brake': 'ABS_BRAKE',
+    'gas': 'ABS_GAS', 'rudder': 'ABS_RUDDER', 'wheel': 'ABS_WHEEL',
+}
+GAMEPAD_RESOLUTION = 32767
+
+
+def iter_bits(mask):
+    """Itera os índices dos bits ligados em mask (do menor para o maior)."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def edges(mask, last_mask):
+    """Retorna (subida, descida) como bitmasks a partir de dois estados."""
+    changed = mask ^ last_mask
+    return changed & mask, changed & last_mask
+
+
+def poll_button_mask(js, num_buttons):
+    """Lê todos os botões (um a um) e monta o bitmask. Usado só na sincronização."""
+    mask = 0
+    for b in range(num_buttons):
+        if js.get_button(b):
+            mask |= 1 << b
+    return mask
+
+
+class PygameInput:
+    """
+    Entrada via joystick pygame.
+
+    - botões: bitmask mantido pelos eventos JOYBUTTONDOWN/JOYBUTTONUP
+      (sincronizado por leitura completa só na criação)
+    - eixos: lista com todos os eixos lidos na mesma amostra
+    """
+
+    def __init__(self, js):
+        self.js = js
+        self.num_buttons = js.get_numbuttons()
+        self.num_axes = js.get_numaxes()
+        if hasattr(js, "get_instance_id"):
+            self.instance_id = js.get_instance_id()
+        else:
+            self.instance_id = js.get_id()
+        pygame.event.pump()
+        self.mask = poll_button_mask(js, self.num_buttons)
+
+    def read_axes(self):
+        axes = []
+        for a in range(self.num_axes):
+            try:
+                axes.append(self.js.get_axis(a))
+            except Exception:
+                axes.append(0.0)
+        return axes
+
+    def poll(self):
+        """Drena a fila de eventos e retorna (bitmask_botões, lista_eixos)."""
+        for ev in pygame.event.get():
+            if ev.type == pygame.JOYBUTTONDOWN or ev.type == pygame.JOYBUTTONUP:
+                if getattr(ev, "instance_id", getattr(ev, "joy", None)) != self.instance_id:
+                    continue
+                if ev.type == pygame.JOYBUTTONDOWN:
+                    self.mask |= 1 << ev.button
+                else:
+                    self.mask &= ~(1 << ev.button)
+        return self.mask, self.read_axes()
+
+
+def axis_value(axes, a):
+    """Valor do eixo a na amostra (0.0 se o dispositivo não tiver esse eixo)."""
+    return axes[a] if 0 <= a < len(axes) else 0.0
+
+
+class UInputGamepad:
+    """
+    Gamepad virtual via uinput (requer python-evdev e acesso a /dev/uinput).
+
+    set_axis() só escreve quando o valor inteiro muda; sync() emite um único
+    SYN_REPORT por tick com todas as mudanças.
+    """
+
+    def __init__(self, axis_names, name="Ardurail Virtual Gamepad"):
+        try:
+            from evdev import UInput, AbsInfo, ecodes
+        except ImportError:
+            raise RuntimeError("Saída analógica requer python-evdev (pip install evdev) no Linux.")
+        self._ecodes = ecodes
+        self.codes = {}
+        for n in axis_names:
+            if n not in GAMEPAD_AXES:
+                raise RuntimeError(f"Eixo de gamepad desconhecido: '{n}' (use {', '.join(GAMEPAD_AXES)})")
+            self.codes[n] = getattr(ecodes, GAMEPAD_AXES[n])
+        absinfo = AbsInfo(value=0, min=-GAMEPAD_RESOLUTION, max=GAMEPAD_RESOLUTION,
+                          fuzz=0, flat=0, resolution=0)
+        caps = {
+            ecodes.EV_ABS: [(c, absinfo) for c in self.codes.values()],
+            ecodes.EV_KEY: [ecodes.BTN_SOUTH],  # alguns jogos só reconhecem gamepads com botão
+        }
+        try:
+            self.ui = UInput(caps, name=name)
+        except Exception as e:
+            raise RuntimeError(f"Não foi possível criar o gamepad virtual ({e}). Verifique permissão em /dev/uinput.")
+        self.last = {}
+        self.dirty = False
+
+    def set_axis(self, name, val):
+        """Define o eixo com val em [-1..1]."""
+        v = int(round(max(-1.0, min(1.0, val)) * GAMEPAD_RESOLUTION))
+        if self.last.get(name) != v:
+            self.ui.write(self._ecodes.EV_ABS, self.codes[name], v)
+            self.last[name] = v
+            self.dirty = True
+
+    def sync(self):
+        if self.dirty:
+            self.ui.syn()
+            self.dirty = False
+
+    def close(self):
+        self.ui.close()
+
+
+class RecordingKeyboard:
+    """
+    Backend de teclado que só registra (t, 'press'|'release', tecla).
+    Usado em replays e simulações; 'clock' é a função de tempo do runtime.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.events = []
+
+    def press(self, k):
+        self.events.append((self.clock(), 'press', k))
+
+    def release(self, k):
+        self.events.append((self.clock(), 'release', k))
@@ -0,0 +1,271 @@
+# characterize.py
+"""
+Caracterização do controle: amostra o joystick o mais rápido que o backend
+permite por uma janela fixa e mede
+
+- taxa real de relatórios do dispositivo e tempo entre relatórios
+- ruído por eixo (pico a pico, desvio padrão) e distribuição do jitter
+  (|Δ| entre relatórios consecutivos), com o passo de quantização
+- bounce dos botões (soltura + novo press, ou press curto, dentro de BOUNCE_WINDOW)
+
+e recomenda sample_rate, deadzone (ou corte de range, se o eixo repousa no
+batente) e histerese para o perfil.
+
+O pygame não expõe o horário de cada relatório, então um relatório é uma
+amostra em que algum botão ou eixo mudou. Com os eixos em repouso absoluto
+(sem ruído nenhum) não há como medir a taxa; o relatório avisa.
+
+Durante a janela: deixe as alavancas PARADAS e aperte alguns botões várias vezes.
+"""
+import bisect
+import json
+import math
+import statistics
+import time
+from pathlib import Path
+
+from backends import edges, iter_bits
+
+BOUNCE_WINDOW = 0.03      # soltura/press mais curtos que isso contam como bounce
+MOVED_THRESHOLD = 0.2     # pico a pico acima disso: o eixo foi mexido (sem recomendação)
+NOISE_MARGIN = 1.5        # folga sobre o ruído medido nas recomendações
+CENTER_REST = 0.1         # |média| abaixo disso: eixo repousa no centro (deadzone central)
+END_REST = 0.9            # |média| acima disso: repousa no batente (corte de range, não deadzone)
+MAX_MULTIPLE = 8          # período testado até moda/8 (relatórios sem mudança somem)
+FIT_TOLERANCE = 0.3       # distância máxima a um múltiplo do período (fração do período)
+FIT_SHARE = 0.8           # fração dos intervalos que o período precisa explicar
+RATE_CHOICES = (120, 125, 250, 500, 1000)   # nunca abaixo de 120: o loop também marca o tempo das saídas
+
+
+def capture(inp, seconds, clock=time.perf_counter):
+    """
+    Amostra inp.poll() em laço fechado por 'seconds' segundos.
+    Retorna {"polls": n, "duration": s, "samples": [(t, mask, axes)]} só com as
+    amostras que mudaram (a primeira sempre entra).
+    """
+    samples = []
+    last = None
+    polls = 0
+    t0 = clock()
+    end = t0 + seconds
+    while True:
+        t = clock()
+        if t >= end:
+            break
+        mask, axes = inp.poll()
+        polls += 1
+        cur = (mask, tuple(axes))
+        if cur != last:
+            samples.append((t - t0, mask, list(axes)))
+            last = cur
+    return {"polls": polls, "duration": clock() - t0, "samples": samples}
+
+
+def _quantiles(values):
+    if not values:
+        return None
+    v = sorted(values)
+    q = lambda p: v[min(len(v) - 1, int(p * (len(v) - 1) + 0.5))]
+    return {"min": v[0], "p50": q(0.50), "p90": q(0.90), "p99": q(0.99), "max": v[-1], "count": len(v)}
+
+
+def _round_up(x, step=0.01):
+    return math.ceil(x / step - 1e-9) * step
+
+
+def _base_interval(intervals):
+    """
+    Período dos relatórios. Relatórios sem mudança não aparecem, então os intervalos
+    são múltiplos k·período (com jitter). Parte do agrupamento mais denso (moda, janela
+    de x1.2) e testa período = moda/k, k = 1, 2, ...: fica o primeiro em que ao menos
+    FIT_SHARE dos intervalos caem a FIT_TOLERANCE de um múltiplo. O período final é o
+    ajuste de mínimos quadrados x ≈ k·p sobre esses intervalos (o jitter se cancela).
+    """
+    v = sorted(x for x in intervals if x > 0)
+    if len(v) < 3:
+        return None
+    best = (0, 0, 0)
+    for i, x in enumerate(v):
+        j = bisect.bisect_right(v, x * 1.2)
+        if j - i > best[0]:
+            best = (j - i, i, j)
+    mode = statistics.median(v[best[1]:best[2]])
+    for k in range(1, MAX_MULTIPLE + 1):
+        p = mode / k
+        fit = [(round(x / p), x) for x in v if round(x / p) >= 1 and abs(x - round(x / p) * p) <= FIT_TOLERANCE * p]
+        if len(fit) >= FIT_SHARE * len(v):
+            return sum(n * x for n, x in fit) / sum(n * n for n, _ in fit)
+    return None
+
+
+def analyze_capture(cap):
+    """Relatório (dict serializável em JSON) a partir do resultado de capture()."""
+    samples = cap["samples"]
+    dur = max(cap["duration"], 1e-9)
+    warnings = []
+
+    # ---- relatórios
+    reports = [t for t, _, _ in samples[1:]]
+    intervals = [b - a for a, b in zip(reports, reports[1:])]
+    iq = _quantiles(intervals)
+    base = _base_interval(intervals)
+    report_rate = 1.0 / base if base else None
+    if report_rate is None and len(intervals) >= 3:
+        warnings.append("Intervalos entre relatórios sem período consistente (jitter alto demais): "
+                        "taxa do dispositivo não medida.")
+    elif report_rate is None:
+        warnings.append("Nenhum relatório suficiente na janela (eixos sem ruído e nenhum botão): "
+                        "taxa do dispositivo não medida.")
+
+    # ---- eixos
+    n_axes = max((len(a) for _, _, a in samples), default=0)
+    axes = {}
+    for a in range(n_axes):
+        vals = [ax[a] for _, _, ax in samples if a < len(ax)]
+        deltas = [abs(y - x) for x, y in zip(vals, vals[1:]) if y != x]
+        ptp = max(vals) - min(vals) if vals else 0.0
+        info = {
+            "mean": statistics.fmean(vals) if vals else 0.0,
+            "stdev": statistics.pstdev(vals) if len(vals) > 1 else 0.0,
+            "peak_to_peak": ptp,
+            "quantization": min(deltas) if deltas else None,
+            "jitter": _quantiles(deltas),
+            "moved": ptp > MOVED_THRESHOLD,
+        }
+        mean = info["mean"]
+        info["rest"] = "center" if abs(mean) < CENTER_REST else ("max" if mean > END_REST else
+                                                                  "min" if mean < -END_REST else "other")
+        if info["moved"]:
+            warnings.append(f"Eixo {a}: variou {ptp:.3f} na janela (foi mexido?); sem recomendação.")
+        else:
+            # histerese é fração do curso total (2.0)
+            info["recommended_hysteresis_range"] = round(ptp * NOISE_MARGIN / 2.0, 4)
+            if info["rest"] == "center":
+                # a deadzone é central (condition_axis): cobre o maior |valor| em repouso
+                info["recommended_deadzone"] = round(_round_up(max(map(abs, vals)) * NOISE_MARGIN), 2)
+            elif info["rest"] in ("min", "max"):
+                # no batente a deadzone central não atua: corta o range para o ruído virar o batente
+                dev = max(abs(v - mean) for v in vals) * NOISE_MARGIN
+                end = min(1.0, mean + dev) if info["rest"] == "min" else max(-1.0, mean - dev)
+                info["recommended_range_end"] = round(end, 3)
+            else:
+                warnings.append(f"Eixo {a}: repousa em {mean:+.3f}, fora do centro e dos batentes; "
+                                "sem recomendação de deadzone/range.")
+        axes[str(a)] = info
+
+    # ---- botões
+    edges_by_button = {}
+    last_mask = samples[0][1] if samples else 0
+    for t, mask, _ in samples[1:]:
+        rising, falling = edges(mask, last_mask)
+        for b in iter_bits(rising):
+            edges_by_button.setdefault(b, []).append((t, 1))
+        for b in iter_bits(falling):
+            edges_by_button.setdefault(b, []).append((t, 0))
+        last_mask = mask
+    buttons = {}
+    worst_bounce = 0.0
+    for b, evs in sorted(edges_by_button.items()):
+        downs = [t1 - t0 for (t0, s0), (t1, s1) in zip(evs, evs[1:]) if s0 == 1 and s1 == 0]
+        ups = [t1 - t0 for (t0, s0), (t1, s1) in zip(evs, evs[1:]) if s0 == 0 and s1 == 1]
+        bounces = [d for d in downs + ups if d < BOUNCE_WINDOW]
+        worst_bounce = max([worst_bounce] + bounces)
+        buttons[str(b)] = {
+            "presses": sum(1 for _, s in evs if s == 1),
+            "shortest_press": min(downs) if downs else None,
+            "shortest_gap": min(ups) if ups else None,
+            "bounces": len(bounces),
+            "bounce_max": max(bounces) if bounces else 0.0,
+        }
+        if bounces:
+            warnings.append(f"Botão {b}: {len(bounces)} bounce(s) de até {max(bounces)*1000:.1f} ms.")
+
+    # ---- recomendações
+    rate = 120
+    if report_rate:
+        rate = next((r for r in RATE_CHOICES if r >= report_rate * 0.95), RATE_CHOICES[-1])
+    poll_rate = cap["polls"] / dur
+    if poll_rate < rate:
+        # maior opção que o laço sustenta, sem descer de RATE_CHOICES[0]
+        rate = max([r for r in RATE_CHOICES if r <= poll_rate] or [RATE_CHOICES[0]])
+        warnings.append(f"O laço só conseguiu {poll_rate:.0f} leituras/s; sample_rate limitado a {rate}"
+                        + ("" if poll_rate >= rate else " (mínimo; a máquina não sustenta nem isso)") + ".")
+
+    return {
+        "duration": dur,
+        "polls": cap["polls"],
+        "poll_rate": poll_rate,
+        "reports": len(reports),
+        "report_rate": report_rate,
+        "report_period": base,
+        "report_interval": iq,
+        "axes": axes,
+        "buttons": buttons,
+        "bounce_max": worst_bounce,
+        "recommended": {"sample_rate": rate},
+        "warnings": warnings,
+    }
+
+
+def apply_to_profile(cfg, rep):
+    """
+    Aplica as recomendações a uma cópia do perfil: sample_rate na raiz,
+    deadzone (repouso no centro) ou corte do range (repouso no batente) nos
+    eixos 'analog' e histerese (em etapas/seções) nos demais.
+    """
+    cfg = json.loads(json.dumps(cfg))
+    cfg["sample_rate"] = rep["recommended"]["sample_rate"]
+    for a, ac in cfg.get("axes", {}).items():
+        info = rep["axes"].get(str(a))
+        if not info or info["moved"]:
+            continue
+        if ac.get("type") == "analog":
+            if "recommended_deadzone" in info:
+                ac["deadzone"] = max(float(ac.get("deadzone", 0.0)), info["recommended_deadzone"])
+            elif "recommended_range_end" in info:
+                lo, hi = ac.get("range", (-1.0, 1.0))
+                if info["rest"] == "min":
+                    lo = max(float(lo), info["recommended_range_end"])
+                else:
+                    hi = min(float(hi), info["recommended_range_end"])
+                ac["range"] = [lo, hi]
+        elif ac.get("type") == "steps_to_buttons":
+            ac["hysteresis"] = round(info["recommended_hysteresis_range"] * int(ac.get("steps", 10)), 2)
+        elif ac.get("type") == "sections_to_keys":
+            n = int(ac.get("buckets", len(ac.get("keys", [])) or 1))
+            ac["hysteresis"] = round(info["recommended_hysteresis_range"] * n, 2)
+    return cfg
+
+
+def format_report(rep):
+    """Texto legível do relatório."""
+    lines = [f"Janela: {rep['duration']:.1f}s | leituras: {rep['polls']} ({rep['poll_rate']:.0f}/s) | "
+             f"relatórios: {rep['reports']}"]
+    if rep["report_rate"]:
+        iq = rep["report_interval"]
+        lines.append(f"Taxa do dispositivo: ~{rep['report_rate']:.0f} Hz "
+                     f"(período {rep['report_period']*1000:.2f} ms) | entre relatórios: "
+                     f"p50 {iq['p50']*1000:.2f} ms, p99 {iq['p99']*1000:.2f} ms, máx {iq['max']*1000:.2f} ms")
+    for a, ax in rep["axes"].items():
+        jit = ax["jitter"]
+        j = f" | jitter p50 {jit['p50']:.4f} p99 {jit['p99']:.4f}" if jit else " | sem jitter"
+        rec = ""
+        if not ax["moved"]:
+            if "recommended_deadzone" in ax:
+                rec = f" | deadzone {ax['recommended_deadzone']:.2f}"
+            elif "recommended_range_end" in ax:
+                rec = f" | repousa no batente ({ax['rest']}): range até {ax['recommended_range_end']:+.3f}"
+            rec += f" | histerese {ax['recommended_hysteresis_range']:.4f} do curso"
+        lines.append(f"Eixo {a}: ruído pico a pico {ax['peak_to_peak']:.4f} (σ {ax['stdev']:.4f}){j}{rec}")
+    for b, bt in rep["buttons"].items():
+        sp = f"{bt['shortest_press']*1000:.1f} ms" if bt["shortest_press"] is not None else "-"
+        lines.append(f"Botão {b}: {bt['presses']} presses | press mais curto {sp} | bounces {bt['bounces']}")
+    lines.append(f"Recomendado: sample_rate {rep['recommended']['sample_rate']} Hz")
+    if rep["warnings"]:
+        lines.append(f"AVISOS ({len(rep['warnings'])}):")
+        lines += [f"  ! {w}" for w in rep["warnings"]]
+    return "\n".join(lines)
+
+
+def write_report(rep, path):
+    Path(path).write_text(json.dumps(rep, indent=2, ensure_ascii=False), encoding="utf-8")
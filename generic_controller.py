@@ -1,10 +1,28 @@
 # generic_controller.py
 import argparse
 import json
+import math
 import time
+from collections import deque
 from pathlib import Path
 import pygame
-from pynput.keyboard import Controller, Key
+from backends import PygameInput, UInputGamepad, axis_value, edges, iter_bits
+from scheduler import OutputScheduler, repeat_priority
+from macros import compile_macro
+from statefeed import DEFAULT_NAME as FEED_NAME, StateFeed, key_label
+from metrics import Metrics, add_metrics_args, start_exporters
+from session import SessionRecorder
+from runtime import LOOP_HZ, RealRuntime
+
+try:
+    from pynput.keyboard import Controller, Key
+except ImportError:
+    # sem servidor gráfico (replay/tuner headless): teclas especiais viram rótulos
+    class _KeyLabels:
+        def __getattr__(self, name):
+            return name
+    Controller = None
+    Key = _KeyLabels()
 
 # ====== Teclas especiais suportadas ======
 SPECIALS = {
@@ -48,8 +66,6 @@ SPECIALS = {
     'num_enter': Key.enter,  # Enter do numérico → Enter padrão
 }
 
-kb = Controller()
-
 def resolve_key(k):
     if isinstance(k, str) and len(k) == 1:
         return k
@@ -57,130 +73,170 @@ def resolve_key(k):
         return SPECIALS.get(k.lower(), k)
     return k
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--profile", required=True, help="Nome do perfil salvo no profiles.json")
-    args = ap.parse_args()
-
-    data = json.loads(Path("profiles.json").read_text(encoding="utf-8"))
-    if args.profile not in data:
-        print(f"Perfil '{args.profile}' não encontrado.")
-        return
-    cfg = data[args.profile]
-
-    joystick_id = cfg.get("joystick_id", 0)
-
-    # DURAÇÕES PADRÃO (segundos)
-    press_hold_seconds = float(cfg.get("press_hold_seconds", 0.12))          # press normal
-    button_hold_repeat_hold = float(cfg.get("button_hold_repeat_hold", 0.06))# duração de cada repetição no modo HOLD
-    repeat_delay = float(cfg.get("repeat_delay", 0.35))                      # atraso inicial do HOLD
-    repeat_interval = float(cfg.get("repeat_interval", 0.05))                # intervalo do HOLD
-
-    pygame.init()
-    pygame.joystick.init()
-    if pygame.joystick.get_count() == 0:
-        print("Nenhum joystick encontrado.")
-        return
-    js = pygame.joystick.Joystick(joystick_id); js.init()
-    print(f"Perfil: {args.profile} | Joystick: {js.get_name()}")
-
-    # Estados
-    num_buttons = js.get_numbuttons()
-    last_button = [0]*num_buttons
-    hold_state = {}        # botão -> {"held": bool, "next": t}
-    active_holds = {}      # keyobj -> release_time
-
-    axes_cfg = cfg.get("axes", {})
-    axis_state = {}        # estados por eixo
-    # sections:
-    section_repeat = {}    # axis -> next_time
-    section_bucket = {}    # axis -> last_bucket
-    # steps:
-    step_queue = {}        # axis -> {"pos": int, "neg": int, "next": float}
-
-    def schedule_press(key_label, now, hold_s=None, force_instant=False):
-        """
-        - press/hold: usa hold_s (ou press_hold_seconds) para manter pressionado antes de soltar
-        - instant: tap seco (apenas se force_instant=True explicitamente)
-        """
-        keyobj = resolve_key(key_label)
-
-        if force_instant:
-            kb.press(keyobj); kb.release(keyobj)
-            return
-
-        end_time = now + (hold_s if hold_s is not None else press_hold_seconds)
-        if keyobj in active_holds:
-            active_holds[keyobj] = end_time
-        else:
-            kb.press(keyobj)
-            active_holds[keyobj] = end_time
-
-    def process_releases(now):
-        to_rel = [k for k,t in active_holds.items() if now >= t]
-        for k in to_rel:
-            try: kb.release(k)
-            except: pass
-            active_holds.pop(k, None)
-
-    def axis_to_step(val, steps, invert=False):
-        if invert: val = -val
-        norm = (val + 1.0)/2.0
-        norm = max(0.0, min(1.0, norm))
-        s = int(norm*steps + 1e-9)
-        return max(0, min(steps, s))
-
-    def axis_to_bucket(val, buckets, invert=False):
-        if invert: val = -val
-        norm = (val + 1.0)/2.0
-        norm = max(0.0, min(1.0, norm))
-        idx = int(norm*buckets - 1e-9)
-        return max(0, min(buckets-1, idx))
-
-    clock = pygame.time.Clock()
-
-    while True:
-        pygame.event.pump()
-        now = time.time()
-
-        # ---- Botões
-        for b in range(num_buttons):
-            s = js.get_button(b)
-            bmap = cfg.get("buttons", {}).get(str(b))
-            if bmap:
-                mode = bmap.get("mode", "single")  # 'single' | 'hold' | 'instant'
-                key = bmap.get("key")
-                press_seconds_override = bmap.get("press_seconds")  # opcional por botão
-
-                # borda de subida
-                if s == 1 and last_button[b] == 0:
-                    if mode == "hold":
-                        schedule_press(key, now, hold_s=button_hold_repeat_hold)
-                        hold_state[b] = {"held": True, "next": now + repeat_delay}
-                    elif mode == "instant":
-                        schedule_press(key, now, force_instant=True)
-                    else:  # single (press normal com duração mínima)
-                        duration = float(press_seconds_override) if press_seconds_override else press_hold_seconds
-                        schedule_press(key, now, hold_s=duration)
-
-                # mantendo
-                if s == 1 and last_button[b] == 1 and mode == "hold":
-                    info = hold_state.get(b)
-                    if info and now >= info["next"]:
-                        schedule_press(key, now, hold_s=button_hold_repeat_hold)
-                        info["next"] = now + repeat_interval
-
-                # borda de descida
-                if s == 0 and last_button[b] == 1 and b in hold_state:
-                    hold_state.pop(b, None)
-
-            last_button[b] = s
+def is_key_name(k):
+    """True se k é um nome de tecla que resolve_key entende (caractere único ou SPECIALS)."""
+    return isinstance(k, str) and (len(k) == 1 or k.lower() in SPECIALS)
+
+def condition_axis(val, ac):
+    """
+    Condiciona o valor bruto [-1..1] de um eixo analógico:
+    range (calibração) -> invert -> deadzone central -> curva (expoente).
+    """
+    lo, hi = ac.get("range", (-1.0, 1.0))
+    if hi != lo:
+        val = (val - lo) / (hi - lo) * 2.0 - 1.0
+    val = max(-1.0, min(1.0, val))
+    if ac.get("invert", False):
+        val = -val
+    dz = float(ac.get("deadzone", 0.0))
+    if abs(val) <= dz:
+        return 0.0
+    if dz > 0.0:
+        val = math.copysign((abs(val) - dz) / (1.0 - dz), val)
+    curve = float(ac.get("curve", 1.0))
+    if curve != 1.0:
+        val = math.copysign(abs(val) ** curve, val)
+    return val
+
+def axis_to_step(val, steps, invert=False):
+    if invert: val = -val
+    norm = (val + 1.0)/2.0
+    norm = max(0.0, min(1.0, norm))
+    s = int(norm*steps + 1e-9)
+    return max(0, min(steps, s))
+
+def axis_to_bucket(val, buckets, invert=False):
+    if invert: val = -val
+    norm = (val + 1.0)/2.0
+    norm = max(0.0, min(1.0, norm))
+    idx = int(norm*buckets - 1e-9)
+    return max(0, min(buckets-1, idx))
+
+def hysteresis_hold(val, n, invert, last, hyst):
+    """True se a posição ainda está a menos de hyst (em etapas) da faixa atual."""
+    if invert: val = -val
+    x = max(0.0, min(1.0, (val + 1.0)/2.0)) * n
+    return last - hyst <= x < last + 1 + hyst
+
+def analog_outputs(cfg):
+    """Eixos do gamepad virtual usados pelo perfil."""
+    return sorted({ac.get("out_axis", "x") for ac in cfg.get("axes", {}).values() if ac["type"] == "analog"})
+
+class GenericEngine:
+    """
+    Motor do controlador genérico, sem I/O próprio: a cada tick recebe
+    (now, bitmask de botões, lista de eixos) e agenda as teclas no
+    OutputScheduler. O mesmo motor roda ao vivo (main) e em replays com
+    relógio virtual (tuner.py).
+    """
+
+    def __init__(self, cfg, kb, metrics=None, pad=None):
+        # DURAÇÕES PADRÃO (segundos)
+        self.press_hold_seconds = float(cfg.get("press_hold_seconds", 0.12))          # press normal
+        self.button_hold_repeat_hold = float(cfg.get("button_hold_repeat_hold", 0.06))# duração de cada repetição no modo HOLD
+        self.repeat_delay = float(cfg.get("repeat_delay", 0.35))                      # atraso inicial do HOLD
+        self.repeat_interval = float(cfg.get("repeat_interval", 0.05))                # intervalo do HOLD
+
+        self.buttons_cfg = {int(b): m for b, m in cfg.get("buttons", {}).items()}
+        self.bound_mask = 0        # só botões mapeados geram bordas
+        for b in self.buttons_cfg:
+            self.bound_mask |= 1 << b
+        # macros compiladas uma vez: botão -> [(offset_s, 'press'|'release', tecla)]
+        self.macros = {}
+        for b, bm in self.buttons_cfg.items():
+            if bm.get("mode") == "macro":
+                try:
+                    self.macros[b] = compile_macro(bm.get("macro", ""),
+                                                   tap_hold=float(bm.get("press_seconds") or self.press_hold_seconds),
+                                                   is_key=is_key_name)
+                except ValueError as e:
+                    raise ValueError(f"Botão {b}: {e}") from None
+        self.axes_cfg = {int(a): ac for a, ac in cfg.get("axes", {}).items()}
+        self.pad = pad             # gamepad virtual para eixos "analog"
+
+        # Estados
+        self.last_mask = None
+        self.hold_state = {}       # botão -> {"held": bool, "next": t}
+        self.axis_state = {}       # estados por eixo
+        # sections:
+        self.section_repeat = {}   # axis -> next_time
+        self.section_bucket = {}   # axis -> last_bucket
+        # steps:
+        self.step_queue = {}       # axis -> {"pos": int, "neg": int, "next": float, "burst": int, "burst_dir": ±1}
+
+        # métricas (contadores baratos; exportação em thread separada)
+        m = self.metrics = metrics if metrics is not None else Metrics()
+        m.counter("step_taps_queued_total", "Taps de etapa pedidos pela alavanca")
+        m.counter("step_taps_coalesced_total", "Taps de etapa cancelados por movimentos opostos na fila")
+        m.counter("step_taps_sent_total", "Taps de etapa que saíram como press real (não fundidos)")
+        m.counter("axis_transitions_suppressed_total", "Mudanças de etapa/seção seguradas pela histerese")
+        m.counter("step_taps_predicted_total", "Ticks com alvo de etapa adiantado pela predição")
+        m.counter("step_resyncs_total", "Re-sincronizações de eixo de etapas no batente")
+        m.counter("step_resync_taps_total", "Taps enviados em rajadas de re-sincronização")
+        m.counter("loop_overruns_total", "Ticks cujo processamento passou do período do loop")
+        m.gauge("step_queue_max", "Maior número de taps de etapa pendentes")
+        m.histogram("loop_work_seconds", "Tempo de processamento de um tick")
+
+        # fila de saída: 'critical'/'high' nunca esperam por repetições ou taps de etapa
+        budget = cfg.get("output_budget")  # máx. saídas normal/low por tick (opcional)
+        self.out = OutputScheduler(kb, resolve_key, default_hold=self.press_hold_seconds,
+                                   budget=int(budget) if budget else None, metrics=m)
+
+    def tick(self, now, mask, axes):
+        """Processa uma amostra e envia a fila de saída."""
+        schedule_press = self.out.schedule_press
+        metrics = self.metrics
+        if self.last_mask is None:
+            self.last_mask = mask   # estado inicial não gera bordas
+
+        # ---- Botões (bordas via XOR; só bits que mudaram são percorridos)
+        rising, falling = edges(mask & self.bound_mask, self.last_mask & self.bound_mask)
+        for b in iter_bits(rising):
+            bmap = self.buttons_cfg[b]
+            mode = bmap.get("mode", "single")  # 'single' | 'hold' | 'instant' | 'resync' | 'macro'
+            key = bmap.get("key")
+            press_seconds_override = bmap.get("press_seconds")  # opcional por botão
+            prio = bmap.get("priority", "normal")  # 'critical' | 'high' | 'normal' | 'low'
+
+            if mode == "hold":
+                schedule_press(key, now, hold_s=self.button_hold_repeat_hold, priority=prio)
+                self.hold_state[b] = {"held": True, "next": now + self.repeat_delay}
+            elif mode == "instant":
+                schedule_press(key, now, force_instant=True, priority=prio)
+            elif mode == "macro":
+                self.out.cancel_sequence(("macro", b))   # reinicia se ainda estava rodando
+                self.out.schedule_sequence(self.macros[b], now, priority=prio, tag=("macro", b))
+            elif mode == "resync":
+                # eixo(s) de etapas voltam a bater com o jogo pelo batente mais próximo
+                for a in ([int(bmap["axis"])] if "axis" in bmap else list(self.axis_state)):
+                    ac = self.axes_cfg.get(a, {})
+                    st = self.axis_state.get(a)
+                    if st and ac.get("type") == "steps_to_buttons":
+                        steps = int(ac.get("steps", 10))
+                        end = steps if st["last_step"] * 2 > steps else 0
+                        self.resync_axis(a, end, int(bmap.get("burst", ac.get("resync_burst", 2))))
+            else:  # single (press normal com duração mínima)
+                duration = float(press_seconds_override) if press_seconds_override else self.press_hold_seconds
+                schedule_press(key, now, hold_s=duration, priority=prio)
+
+        for b in iter_bits(falling):
+            self.hold_state.pop(b, None)
+            if b in self.macros and self.buttons_cfg[b].get("cancel_on_release", True):
+                self.out.cancel_sequence(("macro", b))
+
+        # mantendo (só botões em modo hold atualmente pressionados)
+        for b, info in self.hold_state.items():
+            if now >= info["next"]:
+                bmap = self.buttons_cfg[b]
+                schedule_press(bmap.get("key"), now, hold_s=self.button_hold_repeat_hold,
+                               priority=repeat_priority(bmap.get("priority", "normal")))
+                info["next"] = now + self.repeat_interval
+
+        self.last_mask = mask
 
         # ---- Eixos
-        for a_str, ac in axes_cfg.items():
-            a = int(a_str)
-            try: val = js.get_axis(a)
-            except: val = 0.0
+        for a, ac in self.axes_cfg.items():
+            val = axis_value(axes, a)
 
             if ac["type"] == "steps_to_buttons":
                 steps = int(ac.get("steps", 10))
@@ -189,28 +245,68 @@ def main():
                 key_neg = ac.get("key_neg", "up")    # delta < 0
                 tap_hold = float(ac.get("tap_hold", 0.06))
                 tap_interval = float(ac.get("tap_interval", 0.06))
+                prio = ac.get("priority", "low")
+                hyst = float(ac.get("hysteresis", 0.0))  # fração de etapa
 
-                st = axis_state.setdefault(a, {"last_step": axis_to_step(val, steps, invert)})
                 cur_step = axis_to_step(val, steps, invert)
-                if cur_step != st["last_step"]:
-                    delta = cur_step - st["last_step"]
-                    q = step_queue.setdefault(a, {"pos":0, "neg":0, "next":now})
+                # last_step: alavanca | target: destino da fila | emitted: onde os taps enviados deixaram o jogo
+                st = self.axis_state.setdefault(a, {"last_step": cur_step, "target": cur_step, "emitted": cur_step})
+                if cur_step != st["last_step"] and hyst > 0 and hysteresis_hold(val, steps, invert, st["last_step"], hyst):
+                    metrics.inc("axis_transitions_suppressed_total")
+                    cur_step = st["last_step"]
+                if ac.get("resync", False) and cur_step != st["last_step"] and cur_step in (0, steps):
+                    # alavanca chegou ao batente físico: empurra o jogo até o dele e re-ancora
+                    self.resync_axis(a, cur_step, int(ac.get("resync_burst", 2)))
+                st["last_step"] = cur_step
+
+                # alvo da fila: a etapa da alavanca ou, no modo preditivo, a projetada
+                target = cur_step
+                if ac.get("predict", False):
+                    target = self.predict_step(st, now, val, steps, invert, cur_step, ac)
+                    if target != cur_step:
+                        metrics.inc("step_taps_predicted_total")
+
+                if target != st["target"]:
+                    delta = target - st["target"]
+                    q = self.step_queue.setdefault(a, {"pos":0, "neg":0, "next":now})
+                    # taps opostos ainda na fila se anulam: uma predição desfeita some da fila
                     if delta > 0:
-                        q["pos"] += delta
+                        c = min(delta, q["neg"])
+                        q["neg"] -= c
+                        q["pos"] += delta - c
                     else:
-                        q["neg"] += -delta
-                    st["last_step"] = cur_step
-
-                # dispara sequenciado por eixo
-                q = step_queue.setdefault(a, {"pos":0, "neg":0, "next":now})
-                if now >= q["next"]:
-                    if q["pos"] > 0:
-                        schedule_press(key_pos, now, hold_s=tap_hold)
-                        q["pos"] -= 1
-                        q["next"] = now + tap_interval
+                        c = min(-delta, q["pos"])
+                        q["pos"] -= c
+                        q["neg"] += -delta - c
+                    metrics.inc("step_taps_queued_total", abs(delta))
+                    if c:
+                        metrics.inc("step_taps_coalesced_total", 2*c)
+                    metrics.set_max("step_queue_max", q["pos"] + q["neg"])
+                    st["target"] = target
+
+                # dispara sequenciado por eixo (rajada de re-sincronização primeiro); um tap por
+                # vez e só com a tecla solta, para o jogo ver cada soltura (>= 1 tick entre taps)
+                q = self.step_queue.setdefault(a, {"pos":0, "neg":0, "next":now})
+                if now >= q["next"] and not q.get("inflight"):
+                    d = 0
+                    burst = bool(q.get("burst"))
+                    if burst:
+                        d = q["burst_dir"]
+                    elif q["pos"] > 0:
+                        d = 1
                     elif q["neg"] > 0:
-                        schedule_press(key_neg, now, hold_s=tap_hold)
-                        q["neg"] -= 1
+                        d = -1
+                    key = key_pos if d > 0 else key_neg
+                    if d and self.out.resolve(key) not in self.out.active_holds:
+                        if burst:
+                            q["burst"] -= 1
+                        elif d > 0:
+                            q["pos"] -= 1
+                        else:
+                            q["neg"] -= 1
+                        q["inflight"] = d
+                        schedule_press(key, now, hold_s=tap_hold, priority=prio,
+                                       on_dispatch=self._step_tap_done(a, d, burst))
                         q["next"] = now + tap_interval
 
             elif ac["type"] == "sections_to_keys":
@@ -223,31 +319,268 @@ def main():
                         keys = keys[:buckets]
                 invert = bool(ac.get("invert", False))
                 repeat = bool(ac.get("repeat", False))
-                repeat_interval = float(ac.get("repeat_interval", 0.5))
+                sec_repeat_interval = float(ac.get("repeat_interval", 0.5))
+                prio = ac.get("priority", "normal")
+                hyst = float(ac.get("hysteresis", 0.0))  # fração de seção
 
                 cur_bucket = axis_to_bucket(val, buckets, invert)
-                last_b = section_bucket.get(a, cur_bucket)
+                last_b = self.section_bucket.get(a, cur_bucket)
+                if cur_bucket != last_b and hyst > 0 and hysteresis_hold(val, buckets, invert, last_b, hyst):
+                    metrics.inc("axis_transitions_suppressed_total")
+                    cur_bucket = last_b
 
                 if cur_bucket != last_b:
                     k = keys[cur_bucket]
                     if k:
-                        schedule_press(k, now, hold_s=press_hold_seconds)
-                    section_bucket[a] = cur_bucket
+                        schedule_press(k, now, hold_s=self.press_hold_seconds, priority=prio)
+                    self.section_bucket[a] = cur_bucket
                     if repeat:
-                        section_repeat[a] = now + repeat_interval
+                        self.section_repeat[a] = now + sec_repeat_interval
 
                 elif repeat:
-                    nxt = section_repeat.get(a, now + repeat_interval)
+                    nxt = self.section_repeat.get(a, now + sec_repeat_interval)
                     if now >= nxt:
                         k = keys[cur_bucket]
                         if k:
-                            schedule_press(k, now, hold_s=press_hold_seconds)
-                        section_repeat[a] = now + repeat_interval
+                            schedule_press(k, now, hold_s=self.press_hold_seconds, priority=prio)
+                        self.section_repeat[a] = now + sec_repeat_interval
+
+            elif ac["type"] == "analog":
+                if self.pad:   # replays/simulação rodam sem gamepad virtual
+                    self.pad.set_axis(ac.get("out_axis", "x"), condition_axis(val, ac))
+
+        if self.pad:
+            self.pad.sync()
+
+        # envia a fila (por prioridade) e solta teclas cuja janela acabou
+        self.out.flush(now)
+
+    def _step_tap_done(self, a, d, burst):
+        """Callback do OutputScheduler para um tap de etapa: só um press real move 'emitted'."""
+        def done(res):
+            st = self.axis_state[a]
+            q = self.step_queue[a]
+            q["inflight"] = 0
+            if res:
+                # o jogo para no batente: taps além dele não contam
+                steps = int(self.axes_cfg[a].get("steps", 10))
+                st["emitted"] = max(0, min(steps, st["emitted"] + d))
+                self.metrics.inc("step_taps_sent_total")
+                if burst:
+                    self.metrics.inc("step_resync_taps_total")
+            elif res is None:
+                # fundido numa tecla que outra saída segurava: o jogo não viu, volta para a fila
+                if burst and q.get("burst_dir") == d:
+                    q["burst"] += 1
+                elif d > 0:
+                    q["pos"] += 1
+                else:
+                    q["neg"] += 1
+        return done
+
+    def resync_axis(self, a, end, extra=2):
+        """
+        Re-sincroniza o eixo de etapas a com o jogo pelo batente end (0 ou steps).
+        Troca os taps pendentes por uma rajada até o batente: a distância que
+        o jogo deveria ter até ele mais 'extra' taps de margem (cobre até
+        'extra' notches de deriva; no máximo steps + extra). Depois da rajada a fila
+        leva o jogo de volta à alavanca a partir do batente.
+        """
+        st = self.axis_state[a]
+        steps = int(self.axes_cfg[a].get("steps", 10))
+        q = self.step_queue.setdefault(a, {"pos":0, "neg":0, "next":0.0})
+        expected = max(0, min(steps, st["emitted"] + q.get("inflight", 0)
+                              + q.get("burst", 0)*q.get("burst_dir", 0)))
+        q["burst"] = abs(end - expected) + max(0, extra)
+        q["burst_dir"] = 1 if end > 0 else -1
+        q["pos"] = q["neg"] = 0
+        st["target"] = end
+        self.metrics.inc("step_resyncs_total")
+        self.metrics.set_max("step_queue_max", q["burst"])
+
+    def predict_step(self, st, now, val, steps, invert, cur_step, ac):
+        """
+        Etapa para onde a alavanca está indo, pela velocidade nas últimas
+        predict_window s, projetada predict_horizon s à frente. Fica entre a
+        etapa atual e predict_max_overshoot etapas além dela, no sentido do
+        movimento; abaixo de predict_min_speed (etapas/s) volta à etapa atual,
+        então uma parada antecipada é corrigida na hora.
+        """
+        if invert: val = -val
+        x = max(0.0, min(1.0, (val + 1.0)/2.0)) * steps
+        hist = st.setdefault("hist", deque())
+        hist.append((now, x))
+        window = float(ac.get("predict_window", 0.05))
+        # cada amostra vale até a próxima: guarda só a que cobre now - window e as mais novas,
+        # então ticks ociosos pulados (entrada constante) não mudam a velocidade
+        edge = now - window
+        while len(hist) > 1 and hist[1][0] <= edge:
+            hist.popleft()
+        t0, x0 = hist[0]
+        span = min(window, now - t0)
+        if span <= 0:
+            return cur_step
+        v = (x - x0) / span
+        if abs(v) < float(ac.get("predict_min_speed", 2.0)):
+            return cur_step
+        proj = int(max(0.0, min(steps, x + v*float(ac.get("predict_horizon", 0.1)))) + 1e-9)
+        over = int(ac.get("predict_max_overshoot", 1))
+        if v > 0:
+            return max(cur_step, min(proj, cur_step + over))
+        return min(cur_step, max(proj, cur_step - over))
+
+    def next_deadline(self):
+        """
+        Menor instante com trabalho agendado (soltura, repetição, tap de etapa),
+        ou None se o motor está ocioso até a entrada mudar.
+        """
+        if self.out.queue:
+            return 0.0   # saídas adiadas pelo budget: próximo tick
+        ts = [t for t in self.out.active_holds.values() if t != math.inf]
+        if self.out.timed:
+            ts.append(self.out.next_timed())
+        ts += [info["next"] for info in self.hold_state.values()]
+        ts += [q["next"] for q in self.step_queue.values() if q["pos"] or q["neg"] or q.get("burst")]
+        ts += self.section_repeat.values()
+        for st in self.axis_state.values():
+            hist = st.get("hist")
+            if hist and any(x != hist[-1][1] for _, x in hist):
+                return 0.0   # velocidade ainda assentando: cada tick conta
+        return min(ts) if ts else None
+
+    def run(self, rt, ticks=None, on_tick=None, fast_forward=False):
+        """
+        Loop principal sobre um runtime (relógio, espera e I/O injetados):
+        poll -> tick -> on_tick(now, mask, axes) -> sleep.
+        fast_forward (só SimRuntime): pula ticks em que nada pode acontecer.
+        """
+        metrics = self.metrics
+        loop_period = 1.0 / rt.loop_hz
+        n = 0
+        while (ticks is None or n < ticks) and not rt.finished():
+            t_work = time.perf_counter()
+            mask, axes = rt.poll()
+            now = rt.now()
+
+            self.tick(now, mask, axes)
+            if on_tick:
+                on_tick(now, mask, axes)
+
+            work = time.perf_counter() - t_work
+            metrics.observe("loop_work_seconds", work)
+            if work > loop_period:
+                metrics.inc("loop_overruns_total")
+
+            rt.sleep()
+            n += 1
+            if fast_forward:
+                dl = self.next_deadline()
+                rt.advance_to(dl if dl is not None else math.inf)
+
+    def pending_steps(self):
+        """Taps de etapa ainda na fila (todos os eixos)."""
+        return sum(q["pos"] + q["neg"] + q.get("burst", 0) for q in self.step_queue.values())
+
+    def publish(self, feed, now, mask, axes):
+        """Publica o estado atual no feed de memória compartilhada."""
+        steps_now = [-1]*len(axes)
+        buckets_now = [-1]*len(axes)
+        for a, st in self.axis_state.items():
+            if a < len(axes): steps_now[a] = st["last_step"]
+        for a, bk in self.section_bucket.items():
+            if a < len(axes): buckets_now[a] = bk
+        feed.publish(now, mask, axes, steps_now, buckets_now,
+                     step_queue=self.pending_steps(),
+                     out_queue=len(self.out.queue),
+                     held=[key_label(k) for k in self.out.active_holds])
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--profile", required=True, help="Nome do perfil salvo no profiles.json")
+    ap.add_argument("--shm", nargs="?", const=FEED_NAME, default=None, metavar="NOME",
+                    help=f"Publica o estado ao vivo em memória compartilhada (padrão {FEED_NAME})")
+    ap.add_argument("--record", metavar="ARQUIVO",
+                    help="Grava a sessão de entrada (JSONL) para replay/ajuste com tuner.py")
+    add_metrics_args(ap)
+    args = ap.parse_args()
 
-        # soltar teclas cuja janela acabou
-        process_releases(now)
+    data = json.loads(Path("profiles.json").read_text(encoding="utf-8"))
+    if args.profile not in data:
+        print(f"Perfil '{args.profile}' não encontrado.")
+        return
+    cfg = data[args.profile]
+
+    if Controller is None:
+        print("[ERRO] pynput não conseguiu acessar o teclado (servidor gráfico indisponível).")
+        return
+    kb = Controller()
+
+    joystick_id = cfg.get("joystick_id", 0)
+
+    pygame.init()
+    pygame.joystick.init()
+    if pygame.joystick.get_count() == 0:
+        print("Nenhum joystick encontrado.")
+        return
+    js = pygame.joystick.Joystick(joystick_id); js.init()
+    print(f"Perfil: {args.profile} | Joystick: {js.get_name()} | loop {int(cfg.get('sample_rate', LOOP_HZ))} Hz")
+
+    inp = PygameInput(js)
+
+    # eixos "analog" saem direto num gamepad virtual (sem taps de teclado)
+    pad = None
+    analog_out = analog_outputs(cfg)
+    if analog_out:
+        try:
+            pad = UInputGamepad(analog_out)
+        except RuntimeError as e:
+            print(f"[ERRO] {e}")
+            return
+        print(f"Gamepad virtual: eixos {', '.join(analog_out)}")
+
+    metrics = Metrics()
+    try:
+        engine = GenericEngine(cfg, kb, metrics, pad)
+    except ValueError as e:
+        print(f"[ERRO] Perfil inválido: {e}")
+        if pad:
+            pad.close()
+        return
+    engine.last_mask = inp.mask
+
+    # exportadores antes do feed/gravação: porta ocupada não deixa nada aberto para trás
+    try:
+        stop_exporters = start_exporters(metrics, args)
+    except OSError as e:
+        print(f"[ERRO] Métricas: {e}")
+        if pad:
+            pad.close()
+        return
 
-        clock.tick(120)
+    feed = StateFeed(args.shm) if args.shm else None
+    loop_hz = int(cfg.get("sample_rate", LOOP_HZ))   # medido com mechanik_controller.py --characterize
+    rec = SessionRecorder(args.record, args.profile, loop_hz, time.time()) if args.record else None
+
+    def on_tick(now, mask, axes):
+        if rec:
+            rec.write(now, mask, axes)
+        if feed:
+            engine.publish(feed, now, mask, axes)
+
+    try:
+        engine.run(RealRuntime(inp, kb, loop_hz), on_tick=on_tick if (rec or feed) else None)
+    except KeyboardInterrupt:
+        print("\nEncerrado pelo usuário.")
+    finally:
+        engine.out.release_all()
+        if pad:
+            pad.close()
+        if feed:
+            feed.close()
+        if rec:
+            rec.close()
+        stop_exporters()
+        print(engine.out.format_stats())
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,19 @@
 # launcher.py
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")   # --json: nada antes do JSON no stdout
+
+import argparse
 import json
 import sys
 import subprocess
 from pathlib import Path
 import time
 import pygame
+import characterize
+from backends import GAMEPAD_AXES, PygameInput
+from generic_controller import is_key_name
+from macros import compile_macro
+from profile_analyzer import analyze_profile, format_report
 
 PROFILES_PATH = Path("profiles.json")
 MECHANIK_SCRIPT = "mechanik_controller.py"  # seu script oficial
@@ -158,14 +167,46 @@ def configure_button(profile):
         print("Cancelado.")
         return
 
-    key = input_key_with_help("Digite a tecla a ser acionada (ex: a, s, space, delete, pageup, pagedown...): ")
-
     print("Tipo de botão:")
     print("1 - press (normal)   [um acionamento com duração mínima]")
     print("2 - hold (auto-repeat enquanto pressionado)")
     print("3 - instant (tap seco)  [avançado, não recomendado]")
-    t = input_int("> ", valid={1,2,3})
-    mode = {1:"single", 2:"hold", 3:"instant"}[t]
+    print("4 - resync (re-sincroniza eixos de etapas com o jogo pelo batente)")
+    print("5 - macro (sequência/acorde, ex.: ctrl+shift+d  ou  tab, wait 200 ms, f5)")
+    t = input_int("> ", valid={1,2,3,4,5})
+    mode = {1:"single", 2:"hold", 3:"instant", 4:"resync", 5:"macro"}[t]
+
+    if mode == "resync":
+        profile.setdefault("buttons", {})
+        profile["buttons"][str(btn)] = {"mode": "resync"}
+        ans = input("Eixo de etapas a re-sincronizar [Enter = todos]: ").strip()
+        if ans.isdigit():
+            profile["buttons"][str(btn)]["axis"] = int(ans)
+        print(f"✓ Botão {btn} → re-sincronização" + (f" do eixo {ans}." if ans.isdigit() else " de todos os eixos de etapas."))
+        return
+
+    if mode == "macro":
+        while True:
+            spec = input_nonempty("Macro (passos separados por vírgula; down X / up X / wait N ms): ")
+            try:
+                compile_macro(spec, is_key=is_key_name)
+                break
+            except ValueError as e:
+                print(f"{e}. Tente de novo.")
+        profile.setdefault("buttons", {})
+        profile["buttons"][str(btn)] = {"mode": "macro", "macro": spec}
+        if input_int("Cancelar a macro ao soltar o botão? 1=sim, 0=não (roda até o fim): ", valid={0,1}) == 0:
+            profile["buttons"][str(btn)]["cancel_on_release"] = False
+        print(f"✓ Botão {btn} → macro '{spec}'.")
+        return
+
+    key = input_key_with_help("Digite a tecla a ser acionada (ex: a, s, space, delete, pageup, pagedown...): ")
+
+    print("Prioridade da saída:")
+    print("1 - normal")
+    print("2 - alta    [passa na frente de taps de eixo e repetições]")
+    print("3 - crítica [ex.: freio de emergência, portas]")
+    priority = {1:"normal", 2:"high", 3:"critical"}[input_int("> ", valid={1,2,3})]
 
     press_seconds = None
     if mode == "single":
@@ -183,6 +224,8 @@ def configure_button(profile):
     }
     if press_seconds is not None:
         profile["buttons"][str(btn)]["press_seconds"] = press_seconds
+    if priority != "normal":
+        profile["buttons"][str(btn)]["priority"] = priority
 
     print(f"✓ Botão {btn} → '{key}' ({mode}" + (f", {press_seconds:.2f}s" if press_seconds else "") + ").")
 
@@ -200,7 +243,8 @@ def configure_axis(profile):
     print("\nTipo de mapeamento do eixo:")
     print("1 - passos (escolher duas teclas para + e -)")
     print("2 - seções (definir quantas seções e tecla por seção)")
-    t = input_int("> ", valid={1,2})
+    print("3 - analógico (gamepad virtual, Linux/uinput) [posição contínua, sem taps]")
+    t = input_int("> ", valid={1,2,3})
 
     profile.setdefault("axes", {})
 
@@ -221,8 +265,41 @@ def configure_axis(profile):
             "tap_hold": tap_hold,
             "tap_interval": tap_interval
         }
+        if input_int("Modo preditivo (adianta taps pela velocidade da alavanca)? 1=sim, 0=não: ", valid={0,1}) == 1:
+            over = 1
+            try:
+                over = int(input("Máximo de etapas além da alavanca [Enter = 1]: ").strip() or 1)
+            except ValueError:
+                print("Valor inválido, usando 1.")
+            profile["axes"][str(axis)].update({"predict": True, "predict_max_overshoot": over})
+        if input_int("Re-sincronizar no batente (taps extras quando a alavanca chega ao fim)? 1=sim, 0=não: ", valid={0,1}) == 1:
+            profile["axes"][str(axis)]["resync"] = True
         print(f"✓ Eixo {axis}: passos→({key_pos}/{key_neg}) (steps={steps}, invert={invert}, hold={tap_hold}s, interval={tap_interval}s).")
 
+    elif t == 3:
+        print("Eixos do gamepad virtual: " + " ".join(GAMEPAD_AXES))
+        while True:
+            out_axis = input_nonempty("Eixo de saída (ex.: throttle): ").lower()
+            if out_axis in GAMEPAD_AXES:
+                break
+            print("Eixo inválido.")
+        invert = input_int("Inverter sentido? 1=sim, 0=não: ", valid={0,1}) == 1
+        deadzone, curve = 0.0, 1.0
+        try:
+            deadzone = float(input("Zona morta central (0..1) [Enter = 0]: ").strip() or 0.0)
+            curve = float(input("Curva (expoente; 1 = linear) [Enter = 1]: ").strip() or 1.0)
+        except ValueError:
+            print("Valor inválido, usando zona morta 0 e curva linear.")
+
+        profile["axes"][str(axis)] = {
+            "type": "analog",
+            "out_axis": out_axis,
+            "invert": invert,
+            "deadzone": deadzone,
+            "curve": curve
+        }
+        print(f"✓ Eixo {axis}: analógico → gamepad '{out_axis}' (invert={invert}, deadzone={deadzone}, curve={curve}).")
+
     else:
         buckets = input_int("Quantas seções? (ex.: 11): ")
         invert = input_int("Inverter sentido? 1=sim, 0=não: ", valid={0,1}) == 1
@@ -257,7 +334,7 @@ def create_profile():
         "button_hold_repeat_hold": 0.06,    # cada repetição do HOLD
         "repeat_delay": 0.35,
         "repeat_interval": 0.05,
-        "buttons": {},       # "idx" -> {"key": "a", "mode": "single|hold|instant", "press_seconds": opcional}
+        "buttons": {},       # "idx" -> {"key": "a", "mode": "single|hold|instant|resync|macro", "press_seconds": opcional}
         "axes": {},          # "idx" -> {type, ...}
         "joystick_id": 0
     }
@@ -275,6 +352,9 @@ def create_profile():
             profiles[name] = profile
             save_profiles(profiles)
             print(f"✓ Perfil '{name}' salvo.")
+            rep = analyze_profile(profile, name)
+            if rep["warnings"]:
+                print("\n" + format_report(rep))
             input("Enter para voltar ao menu principal...")
             return
         elif opt == "0":
@@ -282,6 +362,46 @@ def create_profile():
         else:
             print("Opção inválida.")
 
+# ---------- Análise de perfis ----------
+def analyze_menu(profile_names):
+    if not profile_names:
+        print("Nenhum perfil salvo.")
+        return
+    for i, name in enumerate(profile_names, start=1):
+        print(f"{i} - {name}")
+    i = input_int("Perfil a analisar: ", valid=set(range(1, len(profile_names)+1)))
+    name = profile_names[i-1]
+    print("\n" + format_report(analyze_profile(load_profiles()[name], name)))
+    input("\nEnter para voltar...")
+
+# ---------- Caracterização do controle ----------
+def characterize_menu(profile_names):
+    js = init_joystick()
+    if js is None:
+        input("Enter para voltar...")
+        return
+    try:
+        seconds = float(input("Duração da medição (seg.) [Enter = 5]: ").strip() or 5)
+    except ValueError:
+        seconds = 5.0
+    print("Deixe as alavancas PARADAS e aperte alguns botões várias vezes...")
+    rep = characterize.analyze_capture(characterize.capture(PygameInput(js), seconds))
+    print("\n" + characterize.format_report(rep))
+    characterize.write_report(rep, "characterization.json")
+    print("\nRelatório salvo em characterization.json.")
+
+    if profile_names:
+        for i, name in enumerate(profile_names, start=1):
+            print(f"{i} - {name}")
+        ans = input("Aplicar sample_rate/deadzone/histerese a qual perfil? [Enter = nenhum]: ").strip()
+        if ans.isdigit() and 1 <= int(ans) <= len(profile_names):
+            name = profile_names[int(ans)-1]
+            profiles = load_profiles()
+            profiles[name] = characterize.apply_to_profile(profiles[name], rep)
+            save_profiles(profiles)
+            print(f"✓ Perfil '{name}' atualizado (sample_rate {rep['recommended']['sample_rate']} Hz).")
+    input("\nEnter para voltar...")
+
 # ---------- Menu principal dinâmico ----------
 def main_menu():
     while True:
@@ -300,13 +420,20 @@ def main_menu():
             print(f"{i} - {name}")
             num_to_action[str(i)] = ("profile", name)
 
-        print("\n9 - criar nova config")
+        # letras: não colidem com os números dos perfis
+        print("\nc - caracterizar joystick (taxa, ruído, bounce)")
+        print("a - analisar perfil (temporização)")
+        print("9 - criar nova config")
         print("0 - sair")
 
-        opt = input("> ").strip()
+        opt = input("> ").strip().lower()
 
         if opt == "1":
             run_mechanik()
+        elif opt == "c":
+            characterize_menu(profile_names)
+        elif opt == "a":
+            analyze_menu(profile_names)
         elif opt == "9":
             create_profile()
         elif opt == "0":
@@ -321,5 +448,25 @@ def main_menu():
         else:
             print("Opção inválida.")
 
-if __name__ == "__main__":
+def main():
+    ap = argparse.ArgumentParser(description="Ardurail Controller")
+    ap.add_argument("--analyze", metavar="PERFIL", help="Analisa a temporização do perfil e sai")
+    ap.add_argument("--json", action="store_true", help="Com --analyze: saída em JSON")
+    args = ap.parse_args()
+
+    if args.analyze:
+        profiles = load_profiles()
+        if args.analyze not in profiles:
+            print(f"Perfil '{args.analyze}' não encontrado.")
+            sys.exit(1)
+        rep = analyze_profile(profiles[args.analyze], args.analyze)
+        if args.json:
+            print(json.dumps(rep, indent=2, ensure_ascii=False, allow_nan=False, default=str))
+        else:
+            print(format_report(rep))
+        sys.exit(1 if rep["warnings"] else 0)
+
     main_menu()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# macros.py
+"""
+Macros: sequências de teclas com tempo, compiladas ao carregar o perfil.
+
+Formato (texto separado por vírgulas ou lista de passos):
+    "ctrl+shift+d"                 acorde: segura ctrl, shift, d e solta na ordem inversa
+    "tab, wait 200 ms, f5"         tap, espera, tap
+    ["down shift", "a", "wait 0.5s", "up shift"]
+
+Passos:
+    tecla / a+b+c     tap (ou acorde) segurado por tap_hold
+    down X / press X  pressiona X e mantém até 'up X' (ou o fim da macro)
+    up X / release X  solta X
+    wait N ms | wait N s | wait N   espera (sem unidade = ms)
+
+Uma tecla só é pressionada de novo release_gap depois da própria soltura
+("a, a" não solta e aperta no mesmo tick); se preciso, o resto da macro
+é empurrado para frente.
+
+O resultado é uma lista [(offset_s, 'press'|'release', tecla), ...] com
+offsets relativos ao início, que o OutputScheduler executa como eventos
+com hora marcada (sem sleep, sem travar a leitura do joystick).
+"""
+import re
+
+_WAIT = re.compile(r"^wait\s+([0-9]*\.?[0-9]+)\s*(ms|s)?$")
+
+
+def _steps(spec):
+    if isinstance(spec, str):
+        spec = spec.split(",")
+    return [str(s).strip().lower() for s in spec if str(s).strip()]
+
+
+def compile_macro(spec, tap_hold=0.06, chord_gap=0.0, is_key=None, release_gap=1.0 / 60):
+    """
+    Compila a macro em [(offset_s, ação, tecla)] ordenado por offset.
+    chord_gap: espaço entre as teclas de um acorde (0 = mesmo tick, na ordem).
+    is_key: validador opcional de nomes de tecla; ValueError se algo for inválido.
+    release_gap: tempo mínimo solta antes de pressionar a mesma tecla de novo.
+    """
+    def key(k):
+        if not k or (is_key is not None and not is_key(k)):
+            raise ValueError(f"Tecla inválida na macro: '{k}'")
+        return k
+
+    events = []
+    t = 0.0
+    down = []       # teclas pressionadas por 'down X' ainda não soltas
+    released = {}   # tecla -> offset da última soltura
+
+    def wait_release(keys):
+        # atraso para que cada tecla (a i-ésima sai em t + i*chord_gap) fique solta release_gap
+        return max([0.0] + [released[k] + release_gap - (t + i*chord_gap)
+                            for i, k in enumerate(keys) if k in released])
+    for step in _steps(spec):
+        m = _WAIT.match(step)
+        if m:
+            v = float(m.group(1))
+            t += v if m.group(2) == "s" else v / 1000.0
+            continue
+        verb, _, arg = step.partition(" ")
+        if verb in ("down", "press") and arg:
+            k = key(arg.strip())
+            t += wait_release([k])
+            events.append((t, "press", k))
+            down.append(k)
+        elif verb in ("up", "release") and arg:
+            k = key(arg.strip())
+            events.append((t, "release", k))
+            released[k] = t
+            if k in down:
+                down.remove(k)
+        elif " " not in step:
+            chord = [key(k.strip()) for k in step.split("+")]
+            t += wait_release(chord)
+            for i, k in enumerate(chord):
+                events.append((t + i*chord_gap, "press", k))
+            t += (len(chord) - 1)*chord_gap + tap_hold
+            for i, k in enumerate(reversed(chord)):
+                events.append((t + i*chord_gap, "release", k))
+                released[k] = t + i*chord_gap
+            t += (len(chord) - 1)*chord_gap
+        else:
+            raise ValueError(f"Passo de macro inválido: '{step}'")
+    for k in reversed(down):
+        events.append((t, "release", k))
+    if not events:
+        raise ValueError("Macro vazia")
+    return events
+
+
+def macro_duration(events):
+    """Duração total da macro compilada (s)."""
+    return max(t for t, _, _ in events) if events else 0.0
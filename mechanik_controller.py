@@ -13,6 +13,8 @@ Gamepad -> Teclado (Python)
 Extra:
 - Delete e PageDown: instantâneos (press/release imediato)
 - INSPECT: imprime estados (botões/eixos) e NÃO envia teclas.
+- --characterize SEG: mede taxa de relatórios, ruído, jitter e bounce do
+  controle em laço fechado e grava um relatório JSON (sample_rate, deadzone, histerese).
 
 Requisitos: pip install pygame pynput
 """
@@ -22,6 +24,12 @@ import sys
 import argparse
 import pygame
 from pynput.keyboard import Controller, Key
+from backends import PygameInput, axis_value, edges, iter_bits
+from scheduler import OutputScheduler, repeat_priority
+from statefeed import DEFAULT_NAME as FEED_NAME, StateFeed, key_label
+from metrics import Metrics, add_metrics_args, start_exporters
+from runtime import RealRuntime
+import characterize
 
 # ===================== CONFIG PADRÃO =====================
 
@@ -31,6 +39,9 @@ JOYSTICK_ID = 0
 # Ativar modo inspeção (pode ser sobrescrito por --inspect)
 INSPECT = False
 
+# Taxa do loop (Hz); meça a do seu controle com --characterize e passe em --sample-rate
+SAMPLE_RATE = 120
+
 # Duração geral de "segurar" teclas (usada pelo agendador para teclas normais)
 PRESS_HOLD_SECONDS = 0.5
 
@@ -74,6 +85,11 @@ SPECIALS = {
     'down': Key.down,
 }
 
+# Prioridade de saída por botão ('critical' | 'high' | 'normal' | 'low')
+# ex.: {BUTTON_SPACE: 'critical'} -> nunca espera por taps de seta pendentes
+BUTTON_PRIORITIES = {}
+ARROW_TAP_PRIORITY = 'low'
+
 # Botões com comportamento de HOLD (auto-repeat)
 HOLD_BUTTONS = {
     BUTTON_A: 'a',
@@ -96,8 +112,6 @@ AXIS_KEYS_DEBUG  = True
 kb = Controller()
 
 # ---------- Agendador de pressionamentos ----------
-active_holds = {}
-
 def _resolve_key(k):
     """Converte rótulo ('a','space',...) em objeto Key/char para pynput."""
     if isinstance(k, str) and len(k) == 1:
@@ -106,44 +120,30 @@ def _resolve_key(k):
         return SPECIALS.get(k.lower(), k)
     return k
 
-def schedule_press(k, now=None, hold_seconds=PRESS_HOLD_SECONDS, force_instant=False):
+metrics = Metrics()
+metrics.counter("step_taps_queued_total", "Taps de seta pedidos pela alavanca")
+metrics.counter("step_taps_sent_total", "Taps de seta enviados à fila de saída")
+metrics.counter("loop_overruns_total", "Ticks cujo processamento passou do período do loop")
+metrics.gauge("step_queue_max", "Maior número de taps de seta pendentes")
+metrics.histogram("loop_work_seconds", "Tempo de processamento de um tick")
+
+out = OutputScheduler(kb, _resolve_key, default_hold=PRESS_HOLD_SECONDS, metrics=metrics)
+feed = None  # StateFeed (--shm)
+stop_exporters = None
+
+def schedule_press(k, now, hold_seconds=PRESS_HOLD_SECONDS, force_instant=False, priority='normal'):
     """
-    Pressiona e agenda soltura após hold_seconds (não bloqueante).
+    Enfileira pressionamento com soltura após hold_seconds (não bloqueante).
     - force_instant=True -> press/release imediato
     - INSTANT_KEYS -> sempre instantâneas
+    - priority: 'critical'/'high' saem na frente de repetições e taps de seta
     """
-    global active_holds
-    if now is None:
-        now = time.time()
-    keyobj = _resolve_key(k)
-
-    # Instantâneo por regra
-    if force_instant or (isinstance(k, str) and k.lower() in INSTANT_KEYS):
-        kb.press(keyobj)
-        kb.release(keyobj)
-        return
-
-    # Se já está ativa, prorroga a soltura
-    if keyobj in active_holds:
-        active_holds[keyobj] = now + hold_seconds
-        return
+    instant = force_instant or (isinstance(k, str) and k.lower() in INSTANT_KEYS)
+    out.schedule_press(k, now, hold_s=hold_seconds, force_instant=instant, priority=priority)
 
-    # Pressiona e agenda soltura
-    kb.press(keyobj)
-    active_holds[keyobj] = now + hold_seconds
-
-def process_releases(now=None):
-    """Solta quaisquer teclas cujo tempo de segurar tenha expirado."""
-    global active_holds
-    if now is None:
-        now = time.time()
-    to_release = [k for k, t in active_holds.items() if now >= t]
-    for k in to_release:
-        try:
-            kb.release(k)
-        except Exception:
-            pass
-        active_holds.pop(k, None)
+def process_releases(now):
+    """Envia a fila por prioridade e solta teclas cujo tempo de segurar expirou."""
+    out.flush(now)
 
 # --------------------------------------------------------------------
 
@@ -169,12 +169,22 @@ def parse_args():
     p = argparse.ArgumentParser(description="Mapeia joystick -> teclado")
     p.add_argument("--inspect", action="store_true", help="Rodar em modo inspeção (não envia teclas)")
     p.add_argument("--joystick-id", type=int, default=JOYSTICK_ID, help="ID do joystick (padrão 0)")
+    p.add_argument("--sample-rate", type=int, default=SAMPLE_RATE, metavar="HZ",
+                   help=f"Taxa do loop (padrão {SAMPLE_RATE})")
+    p.add_argument("--characterize", type=float, default=None, metavar="SEG",
+                   help="Inspeção em alta taxa: caracteriza o controle por SEG segundos e sai (não envia teclas)")
+    p.add_argument("--report", default="characterization.json", metavar="ARQUIVO",
+                   help="Com --characterize: relatório JSON (padrão characterization.json)")
+    p.add_argument("--shm", nargs="?", const=FEED_NAME, default=None, metavar="NOME",
+                   help=f"Publica o estado ao vivo em memória compartilhada (padrão {FEED_NAME}); "
+                        "permite observar sem --inspect, com as teclas ativas")
+    add_metrics_args(p)
     return p.parse_args()
 
 def main():
-    global INSPECT
+    global INSPECT, feed, stop_exporters
     args = parse_args()
-    if args.inspect:
+    if args.inspect or args.characterize:
         INSPECT = True
     js_id = args.joystick_id
 
@@ -190,111 +200,124 @@ def main():
     print(f"Usando joystick: {js.get_name()} (id={js_id})")
     print(f"Botões detectados: {js.get_numbuttons()}")
     print(f"Eixos detectados:  {js.get_numaxes()}")
+
+    if args.characterize:
+        print(f"\n[CARACTERIZAÇÃO] {args.characterize:g}s em laço fechado: deixe as alavancas PARADAS "
+              "e aperte alguns botões várias vezes...")
+        rep = characterize.analyze_capture(characterize.capture(PygameInput(js), args.characterize))
+        print("\n" + characterize.format_report(rep))
+        characterize.write_report(rep, args.report)
+        print(f"\nRelatório salvo em {args.report} (use sample_rate no perfil ou --sample-rate).")
+        return
     if INSPECT:
         print("\n[MODO INSPECT] Mostrando mudanças de botões e valores de eixos. Nenhuma tecla será enviada.\n")
 
-    num_buttons = js.get_numbuttons()
-    last_state = [0] * num_buttons
+    inp = PygameInput(js)
+    last_mask = inp.mask
+    # relógio, leitura e espera vêm do runtime, como no controlador genérico
+    rt = RealRuntime(inp, kb, 10 if INSPECT else args.sample_rate)
 
     # Estado inicial dos eixos
-    try:
-        axis_val = js.get_axis(ANALOG_AXIS)
-    except Exception:
-        axis_val = 0.0
-    last_axis_step = axis_value_to_step(axis_val)
+    axes = inp.read_axes()
+    last_axis_step = axis_value_to_step(axis_value(axes, ANALOG_AXIS))
 
-    try:
-        axis_keys_val = js.get_axis(ANALOG_AXIS_KEYS)
-    except Exception:
-        axis_keys_val = 0.0
+    axis_keys_val = axis_value(axes, ANALOG_AXIS_KEYS)
     current_bucket = axis_value_to_bucket(axis_keys_val, len(KEY_SEQUENCE), invert=AXIS_KEYS_INVERT)
 
     # Controle de repetição (A/S/End) e (opcional) repetição do eixo Z..M
     hold_state = {}
     current_idx = current_bucket  # alinha índice com bucket inicial
-    next_keys_repeat_time = time.time() + KEYS_REPEAT_INTERVAL
+    next_keys_repeat_time = rt.now() + KEYS_REPEAT_INTERVAL
 
     # Fila sequenciada para setas ↑/↓
     pending_up = 0
     pending_down = 0
-    next_arrow_time = time.time()
+    next_arrow_time = rt.now()
 
-    clock = pygame.time.Clock()
+    if args.shm:
+        feed = StateFeed(args.shm)
+        print(f"Feed de estado em memória compartilhada: '{args.shm}'")
+    try:
+        stop_exporters = start_exporters(metrics, args)
+    except OSError as e:
+        print(f"[ERRO] Métricas: {e}")   # o finally do __main__ fecha o feed
+        return
+    loop_period = 1.0 / args.sample_rate
+
+    def publish(now, mask, axes):
+        steps = [-1] * len(axes)
+        buckets = [-1] * len(axes)
+        if ANALOG_AXIS < len(axes):
+            steps[ANALOG_AXIS] = last_axis_step
+        if ANALOG_AXIS_KEYS < len(axes):
+            buckets[ANALOG_AXIS_KEYS] = current_bucket
+        feed.publish(now, mask, axes, steps, buckets,
+                     step_queue=pending_up + pending_down,
+                     out_queue=len(out.queue),
+                     held=[key_label(k) for k in out.active_holds])
 
     # ===== Loop principal =====
     while True:
-        pygame.event.pump()
-        now = time.time()
+        t_work = time.perf_counter()
+        mask, axes = rt.poll()
+        now = rt.now()
+        rising, falling = edges(mask, last_mask)
+        last_mask = mask
 
         # ----------------- MODO INSPECT -----------------
         if INSPECT:
-            for b in range(num_buttons):
-                state = js.get_button(b)
-                if state != last_state[b]:
-                    print(f"[BOTÃO {b}] -> {'PRESS' if state else 'RELEASE'}")
-                last_state[b] = state
-
-            axis_line = []
-            for a in range(js.get_numaxes()):
-                try:
-                    val = js.get_axis(a)
-                except Exception:
-                    val = 0.0
-                axis_line.append(f"E{a}:{val:+.3f}")
-            print(" | ".join(axis_line))
-
-            clock.tick(10)
+            for b in iter_bits(rising):
+                print(f"[BOTÃO {b}] -> PRESS")
+            for b in iter_bits(falling):
+                print(f"[BOTÃO {b}] -> RELEASE")
+
+            print(" | ".join(f"E{a}:{val:+.3f}" for a, val in enumerate(axes)))
+            if feed:
+                publish(now, mask, axes)
+
+            rt.sleep()
             continue
 
         # ----------------- MODO NORMAL ------------------
 
-        # ===== BOTÕES =====
-        for b in range(num_buttons):
-            state = js.get_button(b)
-
+        # ===== BOTÕES (só os bits que mudaram) =====
+        for b in iter_bits(rising):
+            prio = BUTTON_PRIORITIES.get(b, 'normal')
             if b in HOLD_BUTTONS:
-                key_to_type = HOLD_BUTTONS[b]
-                if state == 1 and last_state[b] == 0:
-                    schedule_press(key_to_type, now)
-                    hold_state[b] = {"held": True, "next_time": now + REPEAT_DELAY}
-                elif state == 1 and last_state[b] == 1:
-                    info = hold_state.get(b)
-                    if info and info.get("held") and now >= info.get("next_time", 0):
-                        schedule_press(key_to_type, now)
-                        info["next_time"] = now + REPEAT_INTERVAL
-                elif state == 0 and last_state[b] == 1:
-                    if b in hold_state:
-                        hold_state.pop(b, None)
-                last_state[b] = state
+                schedule_press(HOLD_BUTTONS[b], now, priority=prio)
+                hold_state[b] = {"held": True, "next_time": now + REPEAT_DELAY}
                 continue
 
-            if state == 1 and last_state[b] == 0:
-                if b == BUTTON_A: schedule_press('a', now); print("A")
-                elif b == BUTTON_S: schedule_press('s', now); print("S")
-                elif b == BUTTON_DEL: schedule_press('delete', now); print("DELETE")
-                elif b == BUTTON_PGDN: schedule_press('pagedown', now); print("PAGEDOWN")
-                elif b == BUTTON_END: schedule_press('end', now); print("END")
-                elif b == BUTTON_SPACE: schedule_press('space', now); print("SPACE")
-                elif b == BUTTON_PREV:
-                    if current_idx > MIN_IDX:
-                        current_idx -= 1
-                        schedule_press(KEY_SEQUENCE[current_idx], now)
-                        print(f"[PREV] idx={current_idx} -> '{KEY_SEQUENCE[current_idx]}'")
-                    else:
-                        print("[PREV] já no mínimo (Z)")
-                elif b == BUTTON_NEXT:
-                    if current_idx < MAX_IDX:
-                        current_idx += 1
-                        schedule_press(KEY_SEQUENCE[current_idx], now)
-                        print(f"[NEXT] idx={current_idx} -> '{KEY_SEQUENCE[current_idx]}'")
-            last_state[b] = state
+            if b == BUTTON_A: schedule_press('a', now, priority=prio); print("A")
+            elif b == BUTTON_S: schedule_press('s', now, priority=prio); print("S")
+            elif b == BUTTON_DEL: schedule_press('delete', now, priority=prio); print("DELETE")
+            elif b == BUTTON_PGDN: schedule_press('pagedown', now, priority=prio); print("PAGEDOWN")
+            elif b == BUTTON_END: schedule_press('end', now, priority=prio); print("END")
+            elif b == BUTTON_SPACE: schedule_press('space', now, priority=prio); print("SPACE")
+            elif b == BUTTON_PREV:
+                if current_idx > MIN_IDX:
+                    current_idx -= 1
+                    schedule_press(KEY_SEQUENCE[current_idx], now, priority=prio)
+                    print(f"[PREV] idx={current_idx} -> '{KEY_SEQUENCE[current_idx]}'")
+                else:
+                    print("[PREV] já no mínimo (Z)")
+            elif b == BUTTON_NEXT:
+                if current_idx < MAX_IDX:
+                    current_idx += 1
+                    schedule_press(KEY_SEQUENCE[current_idx], now, priority=prio)
+                    print(f"[NEXT] idx={current_idx} -> '{KEY_SEQUENCE[current_idx]}'")
+
+        for b in iter_bits(falling):
+            hold_state.pop(b, None)
+
+        # Auto-repeat dos botões HOLD ainda pressionados
+        for b, info in hold_state.items():
+            if info.get("held") and now >= info.get("next_time", 0):
+                schedule_press(HOLD_BUTTONS[b], now, priority=repeat_priority(BUTTON_PRIORITIES.get(b, 'normal')))
+                info["next_time"] = now + REPEAT_INTERVAL
 
         # ===== EIXO 1: ↑/↓ por etapas (sequenciado) =====
-        try:
-            axis_val = js.get_axis(ANALOG_AXIS)
-        except Exception:
-            axis_val = 0.0
-        step = axis_value_to_step(axis_val)
+        step = axis_value_to_step(axis_value(axes, ANALOG_AXIS))
         if step != last_axis_step:
             delta = step - last_axis_step
             if STEP_DEBUG:
@@ -303,24 +326,27 @@ def main():
                 pending_down += delta   # acumula taps de "down"
             else:
                 pending_up += -delta    # acumula taps de "up"
+            metrics.inc("step_taps_queued_total", abs(delta))
+            metrics.set_max("step_queue_max", pending_up + pending_down)
             last_axis_step = step
 
-        # Dispara uma seta de cada vez, respeitando o espaçamento
-        if now >= next_arrow_time:
+        # Dispara uma seta de cada vez, respeitando o espaçamento e só com as setas soltas
+        # (o jogo precisa ver a soltura: um tap sobre a tecla ainda segurada só a prorrogaria)
+        arrows_free = not any(_resolve_key(k) in out.active_holds for k in ('up', 'down'))
+        if now >= next_arrow_time and arrows_free:
             if pending_down > 0:
-                schedule_press('down', now, hold_seconds=ARROW_TAP_HOLD, force_instant=False)
+                schedule_press('down', now, hold_seconds=ARROW_TAP_HOLD, priority=ARROW_TAP_PRIORITY)
                 pending_down -= 1
+                metrics.inc("step_taps_sent_total")
                 next_arrow_time = now + ARROW_TAP_INTERVAL
             elif pending_up > 0:
-                schedule_press('up', now, hold_seconds=ARROW_TAP_HOLD, force_instant=False)
+                schedule_press('up', now, hold_seconds=ARROW_TAP_HOLD, priority=ARROW_TAP_PRIORITY)
                 pending_up -= 1
+                metrics.inc("step_taps_sent_total")
                 next_arrow_time = now + ARROW_TAP_INTERVAL
 
         # ===== EIXO 2: Z..M por seções (sem repetição contínua) =====
-        try:
-            axis_keys_val = js.get_axis(ANALOG_AXIS_KEYS)
-        except Exception:
-            axis_keys_val = 0.0
+        axis_keys_val = axis_value(axes, ANALOG_AXIS_KEYS)
         bucket = axis_value_to_bucket(axis_keys_val, len(KEY_SEQUENCE), invert=AXIS_KEYS_INVERT)
         if bucket != current_bucket:
             if AXIS_KEYS_DEBUG:
@@ -339,10 +365,26 @@ def main():
         # ===== PROCESSA SOLTURAS =====
         process_releases(now)
 
-        clock.tick(120)
+        if feed:
+            publish(now, mask, axes)
+
+        work = time.perf_counter() - t_work
+        metrics.observe("loop_work_seconds", work)
+        if work > loop_period:
+            metrics.inc("loop_overruns_total")
+
+        rt.sleep()
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
         print("\nEncerrado pelo usuário.")
+    finally:
+        out.release_all()
+        if feed:
+            feed.close()
+        if stop_exporters:
+            stop_exporters()
+        if not INSPECT:
+            print(out.format_stats())
@@ -0,0 +1,225 @@
+# metrics.py
+"""
+Contadores e histogramas em processo, com exposição opcional.
+
+No loop só há somas em dict/list (sem locks, sem I/O). A coleta roda numa
+thread em segundo plano:
+- serve_http(): endpoint local no formato texto do Prometheus (/metrics)
+- JsonSnapshotWriter: grava um snapshot JSON periódico (com taxas por segundo)
+
+Todas as séries devem ser registradas antes do loop começar, para que as
+threads de coleta nunca vejam um dict mudando de tamanho.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Buckets (segundos) para latências de injeção de teclas e duração do tick
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class Histogram:
+    """Histograma de buckets fixos (cumulativo só na exportação)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, v):
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+        if v > self.max:
+            self.max = v
+
+    def quantile(self, q):
+        """Estimativa pelo limite superior do bucket que contém o quantil q."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+
+class Metrics:
+    """Registro de séries. Nomes podem levar rótulos: 'x_total{priority="high"}'."""
+
+    def __init__(self, prefix="ardurail"):
+        self.prefix = prefix
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+
+    # ---- registro (antes do loop) ----
+    def counter(self, name, help_text=""):
+        self.counters.setdefault(name, 0)
+        self.help.setdefault(name.split("{")[0], help_text)
+
+    def gauge(self, name, help_text=""):
+        self.gauges.setdefault(name, 0)
+        self.help.setdefault(name.split("{")[0], help_text)
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        self.help.setdefault(name, help_text)
+        return self.histograms.setdefault(name, Histogram(buckets))
+
+    # ---- atualização (no loop) ----
+    def inc(self, name, n=1):
+        self.counters[name] += n
+
+    def set(self, name, v):
+        self.gauges[name] = v
+
+    def set_max(self, name, v):
+        if v > self.gauges[name]:
+            self.gauges[name] = v
+
+    def observe(self, name, v):
+        self.histograms[name].observe(v)
+
+    # ---- exportação (threads de coleta) ----
+    def render_prometheus(self):
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            base = name.split("{")[0]
+            if base not in typed:
+                typed.add(base)
+                if self.help.get(base):
+                    lines.append(f"# HELP {self.prefix}_{base} {self.help[base]}")
+                lines.append(f"# TYPE {self.prefix}_{base} {kind}")
+
+        for name, v in list(self.counters.items()):
+            header(name, "counter")
+            lines.append(f"{self.prefix}_{name} {v}")
+        for name, v in list(self.gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{self.prefix}_{name} {v}")
+        for name, h in list(self.histograms.items()):
+            header(name, "histogram")
+            acc = 0
+            for le, c in zip(h.buckets, h.counts):
+                acc += c
+                lines.append(f'{self.prefix}_{name}_bucket{{le="{le}"}} {acc}')
+            lines.append(f'{self.prefix}_{name}_bucket{{le="+Inf"}} {h.count}')
+            lines.append(f"{self.prefix}_{name}_sum {h.sum}")
+            lines.append(f"{self.prefix}_{name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {
+            "time": time.time(),
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "histograms": {
+                name: {
+                    "count": h.count,
+                    "sum": h.sum,
+                    "max": h.max,
+                    "p50": h.quantile(0.50),
+                    "p90": h.quantile(0.90),
+                    "p99": h.quantile(0.99),
+                }
+                for name, h in list(self.histograms.items())
+            },
+        }
+
+
+def serve_http(metrics, port, host="127.0.0.1"):
+    """Sobe o endpoint /metrics numa thread daemon e retorna o servidor."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class JsonSnapshotWriter:
+    """Grava metrics.snapshot() em path a cada interval segundos (escrita atômica)."""
+
+    def __init__(self, metrics, path, interval=5.0):
+        self.metrics = metrics
+        self.path = Path(path)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._last = None
+        self.thread = threading.Thread(target=self._run, name="metrics-json", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        snap = self.metrics.snapshot()
+        if self._last:
+            dt = snap["time"] - self._last["time"]
+            if dt > 0:
+                snap["rates"] = {
+                    f"{name}_per_second": (v - self._last["counters"].get(name, 0)) / dt
+                    for name, v in snap["counters"].items()
+                }
+        self._last = snap
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(snap, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def stop(self):
+        self._stop.set()
+        self.write()
+
+
+def add_metrics_args(p):
+    """Argumentos de linha de comando comuns aos controladores."""
+    p.add_argument("--metrics-port", type=int, default=None, metavar="PORTA",
+                   help="Expõe métricas Prometheus em http://127.0.0.1:PORTA/metrics")
+    p.add_argument("--metrics-json", default=None, metavar="ARQUIVO",
+                   help="Grava snapshot JSON das métricas periodicamente")
+    p.add_argument("--metrics-interval", type=float, default=5.0, metavar="SEG",
+                   help="Intervalo do snapshot JSON (padrão 5s)")
+
+
+def start_exporters(metrics, args):
+    """Inicia os exportadores pedidos em args; retorna função para encerrá-los."""
+    server = writer = None
+    if args.metrics_port:
+        server = serve_http(metrics, args.metrics_port)
+        print(f"Métricas: http://127.0.0.1:{args.metrics_port}/metrics")
+    if args.metrics_json:
+        writer = JsonSnapshotWriter(metrics, args.metrics_json, args.metrics_interval)
+        print(f"Métricas: snapshot em {args.metrics_json} a cada {args.metrics_interval:g}s")
+
+    def stop():
+        if server:
+            server.shutdown()
+        if writer:
+            writer.stop()
+    return stop
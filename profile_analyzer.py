@@ -0,0 +1,249 @@
+# profile_analyzer.py
+"""
+Análise estática de temporização de um perfil do profiles.json.
+
+Calcula, sem joystick nem jogo:
+- tempo de varredura completa de cada eixo em etapas (0 -> steps)
+- taxa máxima de taps por segundo enviada ao jogo (por eixo e total)
+- teclas compartilhadas entre bindings (uma prorroga o hold da outra) e o
+  atraso extra que o hold de uma impõe às outras
+- taps/repetições que se fundem num hold contínuo (hold >= intervalo)
+- pior latência por prioridade com as filas ocupadas (budget de saída e
+  fila de taps dos eixos de etapas)
+
+Os tempos consideram a granularidade do loop: ações "a cada X s" só saem
+no primeiro tick >= X, então o intervalo efetivo é X arredondado para
+cima em ticks.
+"""
+import math
+
+from generic_controller import is_key_name
+from macros import compile_macro, macro_duration
+from scheduler import PRIO_HIGH, priority_level
+
+LOOP_HZ = 120             # taxa do loop dos controladores
+GAME_FRAME = 1.0 / 60     # menor soltura que um jogo a 60 fps enxerga com segurança
+SLOW_SWEEP = 0.5          # varredura completa acima disso já é perceptível
+MAX_KEY_RATE = 30.0       # taps/s por tecla acima disso costumam ser perdidos
+
+
+def _ticks(seconds, tick):
+    """Quantos ticks até 'seconds' (arredondado para cima, mínimo 1)."""
+    return max(1, math.ceil(seconds / tick - 1e-9))
+
+
+def _binding_keys(cfg):
+    """
+    Lista (tecla, descrição, hold_s) de todas as teclas que o perfil pode enviar.
+    hold_s: quanto cada press segura a tecla (None = enquanto o botão estiver apertado).
+    """
+    press_hold = float(cfg.get("press_hold_seconds", 0.12))
+    out = []
+    for b, bm in cfg.get("buttons", {}).items():
+        if bm.get("key"):
+            mode = bm.get("mode", "single")
+            hold = None if mode == "hold" else 0.0 if mode == "instant" else float(bm.get("press_seconds") or press_hold)
+            out.append((bm["key"].lower(), f"botão {b}", hold))
+    for a, ac in cfg.get("axes", {}).items():
+        if ac.get("type") == "steps_to_buttons":
+            tap_hold = float(ac.get("tap_hold", 0.06))
+            out.append((ac.get("key_pos", "down").lower(), f"eixo {a} (+)", tap_hold))
+            out.append((ac.get("key_neg", "up").lower(), f"eixo {a} (-)", tap_hold))
+        elif ac.get("type") == "sections_to_keys":
+            for i, k in enumerate(ac.get("keys", [])):
+                if k:
+                    out.append((k.lower(), f"eixo {a} seção {i + 1}", press_hold))
+    return out
+
+
+def analyze_profile(cfg, name=None, loop_hz=None):
+    """Retorna um dict com as medidas do perfil e a lista de avisos (loop_hz padrão: sample_rate do perfil)."""
+    loop_hz = int(loop_hz or cfg.get("sample_rate", LOOP_HZ))
+    tick = 1.0 / loop_hz
+    warnings = []
+
+    press_hold = float(cfg.get("press_hold_seconds", 0.12))
+    repeat_hold = float(cfg.get("button_hold_repeat_hold", 0.06))
+    repeat_delay = float(cfg.get("repeat_delay", 0.35))
+    repeat_interval = float(cfg.get("repeat_interval", 0.05))
+    budget = cfg.get("output_budget")
+    budget = int(budget) if budget else None
+
+    axes = []
+    sources = []   # (taps/s, prioridade) de cada fonte periódica de saída
+    for a, ac in sorted(cfg.get("axes", {}).items(), key=lambda kv: int(kv[0])):
+        t = ac.get("type")
+        info = {"axis": int(a), "type": t}
+        if t == "steps_to_buttons":
+            steps = int(ac.get("steps", 10))
+            tap_hold = float(ac.get("tap_hold", 0.06))
+            tap_interval = float(ac.get("tap_interval", 0.06))
+            hold_ticks = _ticks(tap_hold, tick)
+            # o próximo tap espera a soltura do anterior: no mínimo 1 tick com a tecla solta
+            eff = max(_ticks(tap_interval, tick), hold_ticks + 1) * tick
+            hold_eff = hold_ticks * tick
+            gap = eff - hold_eff
+            info.update({
+                "steps": steps,
+                # lever de 0 a steps de uma vez: o último tap sai (steps-1) intervalos depois
+                "backlog_seconds": (steps - 1) * eff if steps > 0 else 0.0,
+                "tap_interval_effective": eff,
+                "taps_per_second": 1.0 / eff,
+                "sweep_seconds": (steps - 1) * eff + hold_eff if steps > 0 else 0.0,
+                "release_gap_seconds": gap,
+                "priority": ac.get("priority", "low"),
+            })
+            sources.append((1.0 / eff, priority_level(ac.get("priority", "low"))))
+            if hold_ticks >= _ticks(tap_interval, tick):
+                warnings.append(f"Eixo {a}: tap_hold ({tap_hold}s) >= tap_interval ({tap_interval}s) no loop de "
+                                f"{loop_hz} Hz; cada tap espera a soltura do anterior, o intervalo real "
+                                f"vira {eff*1000:.1f} ms.")
+            if gap < GAME_FRAME:
+                warnings.append(f"Eixo {a}: soltura entre taps de só {gap*1000:.1f} ms; "
+                                f"o jogo pode perder taps (mínimo recomendado {GAME_FRAME*1000:.0f} ms).")
+            if info["sweep_seconds"] > SLOW_SWEEP:
+                warnings.append(f"Eixo {a}: varredura completa leva {info['sweep_seconds']:.2f}s "
+                                f"({steps} etapas a {eff*1000:.0f} ms).")
+            if ac.get("resync", False):
+                # pior caso: varredura inteira + margem até o batente
+                info["resync_seconds"] = (steps + int(ac.get("resync_burst", 2))) * eff
+            if info["taps_per_second"] > MAX_KEY_RATE:
+                warnings.append(f"Eixo {a}: {info['taps_per_second']:.0f} taps/s excede {MAX_KEY_RATE:.0f}/s.")
+        elif t == "sections_to_keys":
+            buckets = int(ac.get("buckets", len(ac.get("keys", [])) or 1))
+            info["buckets"] = buckets
+            if len(ac.get("keys", [])) != buckets:
+                warnings.append(f"Eixo {a}: {len(ac.get('keys', []))} teclas para {buckets} seções.")
+            if ac.get("repeat", False):
+                eff = _ticks(float(ac.get("repeat_interval", 0.5)), tick) * tick
+                info["taps_per_second"] = 1.0 / eff
+                sources.append((1.0 / eff, priority_level(ac.get("priority", "normal"))))
+                if _ticks(press_hold, tick) >= _ticks(eff, tick):
+                    warnings.append(f"Eixo {a}: repetição a cada {eff:.2f}s com press de {press_hold}s; "
+                                    "as repetições viram um hold contínuo.")
+        axes.append(info)
+
+    buttons = []
+    for b, bm in sorted(cfg.get("buttons", {}).items(), key=lambda kv: int(kv[0])):
+        mode = bm.get("mode", "single")
+        info = {"button": int(b), "key": bm.get("key"), "mode": mode, "priority": bm.get("priority", "normal")}
+        if mode == "hold":
+            eff = _ticks(repeat_interval, tick) * tick
+            info["repeat_delay"] = repeat_delay
+            info["taps_per_second"] = 1.0 / eff
+            rprio = priority_level(bm.get("priority", "normal"))
+            sources.append((1.0 / eff, rprio if rprio <= PRIO_HIGH else priority_level("low")))
+            if _ticks(repeat_hold, tick) >= _ticks(eff, tick):
+                warnings.append(f"Botão {b} ('{bm.get('key')}'): button_hold_repeat_hold ({repeat_hold}s) >= "
+                                f"repeat_interval ({repeat_interval}s); o auto-repeat vira uma tecla segurada "
+                                "sem repetições.")
+        elif mode == "resync":
+            info["axis"] = bm.get("axis")
+        elif mode == "macro":
+            info["macro"] = bm.get("macro")
+            try:
+                ev = compile_macro(bm.get("macro", ""), tap_hold=float(bm.get("press_seconds") or press_hold),
+                                   is_key=is_key_name)
+                info["macro_seconds"] = macro_duration(ev)
+                # eventos caem no primeiro tick >= instante previsto
+                info["macro_timing_error_max"] = tick
+            except ValueError as e:
+                warnings.append(f"Botão {b}: {e}.")
+        elif mode == "single":
+            info["hold_seconds"] = float(bm.get("press_seconds") or press_hold)
+        buttons.append(info)
+
+    # teclas compartilhadas: active_holds é por tecla, então uma prorroga a outra
+    by_key = {}
+    for k, desc, hold in _binding_keys(cfg):
+        by_key.setdefault(k, []).append((desc, hold))
+    shared = {k: [d for d, _ in v] for k, v in by_key.items() if len(v) > 1}
+    shared_delay = {}
+    for k, v in by_key.items():
+        if len(v) < 2:
+            continue
+        # um press novo só é visto depois da soltura do hold em curso (+1 tick solta)
+        holds = [h for _, h in v]
+        shared_delay[k] = None if None in holds else _ticks(max(holds), tick) * tick + tick
+        extra = ("enquanto o botão em modo hold estiver apertado" if shared_delay[k] is None
+                 else f"até {shared_delay[k]*1000:.0f} ms")
+        warnings.append(f"Tecla '{k}' usada por {', '.join(shared[k])}; enquanto uma está segurada "
+                        f"a outra só prorroga o hold (não gera novo press): atraso extra {extra}.")
+
+    # pior caso com todas as fontes ativas ao mesmo tempo
+    max_rate = sum(r for r, _ in sources)
+    per_tick = [0] * 4
+    for r, p in sources:
+        per_tick[p] += 1      # cada fonte gera no máximo uma saída por tick
+    # fila de taps por eixo: com a alavanca varrida de uma vez, o último tap espera o resto
+    backlog = [0.0] * 4
+    for ax in axes:
+        if "backlog_seconds" in ax:
+            p = priority_level(ax["priority"])
+            backlog[p] = max(backlog[p], ax["backlog_seconds"])
+    worst = {}
+    for pname, plevel in (("critical", 0), ("high", 1), ("normal", 2), ("low", 3)):
+        ahead = sum(per_tick[:plevel + 1])
+        if plevel <= PRIO_HIGH or budget is None:
+            worst[pname] = tick
+        elif ahead > budget:
+            worst[pname] = None   # sem limite: a fila pode crescer para sempre
+        else:
+            worst[pname] = tick * math.ceil(max(1, ahead) / budget)
+        if worst[pname] is not None:
+            worst[pname] += backlog[plevel]
+    if budget is not None and sum(per_tick[2:]) > budget:
+        warnings.append(f"output_budget={budget} menor que as {sum(per_tick[2:])} fontes normal/low que podem "
+                        "disparar no mesmo tick; a fila pode crescer sem limite.")
+
+    return {
+        "profile": name,
+        "loop_hz": loop_hz,
+        "axes": axes,
+        "buttons": buttons,
+        "max_taps_per_second": max_rate,
+        "shared_keys": shared,
+        "shared_key_delay_seconds": shared_delay,
+        "worst_latency_seconds": worst,
+        "warnings": warnings,
+    }
+
+
+def format_report(rep):
+    """Texto legível do relatório (para o launcher)."""
+    lines = [f"Análise do perfil '{rep['profile']}' (loop {rep['loop_hz']} Hz)", ""]
+    for ax in rep["axes"]:
+        if ax["type"] == "steps_to_buttons":
+            lines.append(f"Eixo {ax['axis']} (etapas={ax['steps']}): varredura {ax['sweep_seconds']:.2f}s | "
+                         f"{ax['taps_per_second']:.1f} taps/s | intervalo efetivo "
+                         f"{ax['tap_interval_effective']*1000:.1f} ms | soltura {ax['release_gap_seconds']*1000:.1f} ms"
+                         f" | último tap da varredura {ax['backlog_seconds']:.2f}s após a alavanca"
+                         + (f" | resync até {ax['resync_seconds']:.2f}s" if "resync_seconds" in ax else ""))
+        elif ax["type"] == "sections_to_keys":
+            extra = f" | repete {ax['taps_per_second']:.1f}/s" if "taps_per_second" in ax else ""
+            lines.append(f"Eixo {ax['axis']} (seções={ax['buckets']}){extra}")
+        else:
+            lines.append(f"Eixo {ax['axis']} ({ax['type']})")
+    for bt in rep["buttons"]:
+        if bt["mode"] == "resync":
+            alvo = f"eixo {bt['axis']}" if bt.get("axis") is not None else "todos os eixos de etapas"
+            lines.append(f"Botão {bt['button']} → re-sincroniza {alvo}")
+            continue
+        if bt["mode"] == "macro":
+            dur = f" ({bt['macro_seconds']:.2f}s, erro ≤ {bt['macro_timing_error_max']*1000:.1f} ms)" if "macro_seconds" in bt else ""
+            lines.append(f"Botão {bt['button']} → macro '{bt['macro']}'{dur}")
+            continue
+        extra = f" | {bt['taps_per_second']:.1f} repetições/s" if "taps_per_second" in bt else ""
+        lines.append(f"Botão {bt['button']} → '{bt['key']}' ({bt['mode']}, {bt['priority']}){extra}")
+    lines.append("")
+    lines.append(f"Máximo de taps/s no jogo (tudo ativo): {rep['max_taps_per_second']:.1f}")
+    lat = ", ".join(f"{p}={'∞' if v is None else f'{v*1000:.1f} ms'}"
+                    for p, v in rep["worst_latency_seconds"].items())
+    lines.append(f"Pior latência até o envio, filas ocupadas (inclui a fila de taps dos eixos): {lat}")
+    lines.append("")
+    if rep["warnings"]:
+        lines.append(f"AVISOS ({len(rep['warnings'])}):")
+        lines += [f"  ! {w}" for w in rep["warnings"]]
+    else:
+        lines.append("Nenhum aviso.")
+    return "\n".join(lines)
@@ -0,0 +1,131 @@
+# runtime.py
+"""
+Relógio, espera e I/O do loop, injetados por uma única interface.
+
+Um runtime fornece:
+    loop_hz      taxa do loop
+    kb           backend de teclado (press/release)
+    now()        tempo atual (s)
+    poll()       (bitmask_botões, lista_eixos) da amostra atual
+    sleep()      espera até o próximo tick
+    finished()   True quando não há mais entrada (só na simulação)
+
+RealRuntime usa o relógio de parede, o joystick pygame e o teclado real.
+SimRuntime usa um relógio virtual que avança exatamente 1/loop_hz por tick,
+entradas roteirizadas e um teclado gravador: o motor processa a mesma
+sequência (now, botões, eixos) e gera a mesma linha do tempo de teclas,
+sem esperar tempo real. advance_to() pula ticks ociosos até o próximo
+evento, alinhado à grade de ticks.
+"""
+import json
+import math
+import time
+from pathlib import Path
+
+import pygame
+
+from backends import RecordingKeyboard
+from session import load_session
+
+LOOP_HZ = 120
+
+
+class RealRuntime:
+    """Relógio de parede + joystick pygame + teclado real."""
+
+    def __init__(self, inp, kb, loop_hz=LOOP_HZ):
+        self.inp = inp
+        self.kb = kb
+        self.loop_hz = loop_hz
+        self._clock = pygame.time.Clock()
+
+    def now(self):
+        return time.time()
+
+    def poll(self):
+        return self.inp.poll()
+
+    def sleep(self):
+        self._clock.tick(self.loop_hz)
+
+    def finished(self):
+        return False
+
+
+class SimRuntime:
+    """
+    Relógio virtual + entradas roteirizadas + RecordingKeyboard.
+
+    samples: [(t, mask, axes), ...] ordenado por t (ex.: load_session()["samples"]);
+    a simulação roda até o último instante + settle.
+    """
+
+    def __init__(self, samples, loop_hz=LOOP_HZ, settle=0.0):
+        self.samples = samples or [(0.0, 0, [])]
+        self.loop_hz = loop_hz
+        self.period = 1.0 / loop_hz
+        self.end = self.samples[-1][0] + settle
+        self.n = 0   # índice do tick (tempo = n * period, sem acumular erro)
+        # primeiro tick com now() > end (onde finished() para), pela mesma conta de now()
+        self.n_end = math.floor(self.end / self.period) + 1
+        while self.n_end > 0 and (self.n_end - 1) * self.period > self.end:
+            self.n_end -= 1
+        while self.n_end * self.period <= self.end:
+            self.n_end += 1
+        self.i = 0   # amostra vigente
+        self.kb = RecordingKeyboard(self.now)
+
+    def now(self):
+        return self.n * self.period
+
+    def poll(self):
+        t = self.now()
+        s = self.samples
+        while self.i + 1 < len(s) and s[self.i + 1][0] <= t:
+            self.i += 1
+        return s[self.i][1], s[self.i][2]
+
+    def sleep(self):
+        self.n += 1
+
+    def finished(self):
+        return self.now() > self.end
+
+    def advance_to(self, t):
+        """Pula até o primeiro tick >= t, sem passar da próxima mudança de entrada nem do fim."""
+        if self.i + 1 < len(self.samples):
+            t = min(t, self.samples[self.i + 1][0])
+        t = min(t, self.n_end * self.period)
+        n = min(math.ceil(t / self.period - 1e-9), self.n_end)
+        if n > self.n:
+            self.n = n
+
+
+def load_script(path):
+    """
+    Carrega entradas para a simulação:
+    - .jsonl: sessão gravada (generic_controller.py --record)
+    - .json:  roteiro de quadros-chave, cada um muda só o que declara:
+              [{"t": 0.0, "axes": {"1": -1.0}}, {"t": 0.5, "buttons": [17]}, ...]
+    Retorna [(t, mask, axes), ...].
+    """
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        return load_session(path)["samples"]
+
+    frames = json.loads(path.read_text(encoding="utf-8"))
+    samples = []
+    mask = 0
+    axes = []
+    for fr in sorted(frames, key=lambda f: float(f.get("t", 0.0))):
+        if "buttons" in fr:
+            mask = 0
+            for b in fr["buttons"]:
+                mask |= 1 << int(b)
+        for a, v in fr.get("axes", {}).items():
+            a = int(a)
+            if a >= len(axes):
+                axes = axes + [0.0] * (a + 1 - len(axes))
+            axes = axes[:a] + [float(v)] + axes[a + 1:]
+        samples.append((float(fr.get("t", 0.0)), mask, list(axes)))
+    return samples
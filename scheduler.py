@@ -0,0 +1,230 @@
+# scheduler.py
+"""
+Fila de saída com prioridade para o teclado (não bloqueante).
+
+Todos os pressionamentos passam por aqui. A cada tick a fila é drenada em
+ordem de prioridade: 'critical' e 'high' saem sempre no mesmo tick, na frente
+de qualquer repetição ou tap de etapa pendente. O tráfego 'normal'/'low' pode
+ser limitado por tick (output_budget); o que sobrar fica para o próximo tick.
+
+Sequências com hora marcada (macros) ficam num segundo heap ordenado pelo
+instante previsto de cada press/release; saem no primeiro flush() em que
+vencem, antes da fila, sem contar no budget. Os instantes são relativos ao
+início da sequência (não ao envio anterior), então o atraso não acumula.
+"""
+import heapq
+import math
+import time
+
+from metrics import Metrics
+
+# Níveis de prioridade (menor = mais urgente)
+PRIORITIES = {
+    'critical': 0,
+    'high': 1,
+    'normal': 2,
+    'low': 3,
+}
+PRIO_HIGH = PRIORITIES['high']
+
+
+def priority_level(name, default='normal'):
+    """Converte o rótulo de prioridade do perfil em nível numérico."""
+    if name is None:
+        name = default
+    if isinstance(name, int):
+        return max(0, min(len(PRIORITIES) - 1, name))
+    return PRIORITIES.get(str(name).lower(), PRIORITIES[default])
+
+
+def repeat_priority(name):
+    """Repetições de HOLD só mantêm a prioridade se ela for 'critical'/'high'."""
+    return name if priority_level(name) <= PRIO_HIGH else 'low'
+
+
+class OutputScheduler:
+    """
+    Agenda pressionamentos e solturas para um backend com press()/release().
+
+    - press/hold: mantém pressionado por hold_s antes de soltar
+    - instant: press/release imediato
+    - tecla já ativa: só prorroga a soltura
+    - sequência: press/release com hora marcada, cancelável por tag
+    """
+
+    def __init__(self, kb, resolve, default_hold=0.12, budget=None, metrics=None):
+        self.kb = kb
+        self.resolve = resolve
+        self.default_hold = default_hold
+        self.budget = budget          # máx. saídas normal/low por tick (None = sem limite)
+        self.queue = []               # heap (prio, seq, t_perf, key_label, hold_s, instant, t_event, on_dispatch)
+        self._deferred = set()        # seq das saídas já contadas como adiadas
+        self.active_holds = {}        # keyobj -> release_time
+        self.timed = []               # heap (t_due, seq, action, key_label, tag, prio)
+        self.timed_keys = {}          # tag -> {keyobj: None} pressionadas pela sequência (em ordem)
+        self._seq = 0
+
+        m = self.metrics = metrics if metrics is not None else Metrics()
+        self._sent = [f'key_presses_total{{priority="{n}"}}' for n in sorted(PRIORITIES, key=PRIORITIES.get)]
+        for name in self._sent:
+            m.counter(name, "Pressionamentos enviados ao backend")
+        m.counter('key_presses_coalesced_total', "Pressionamentos que só prorrogaram uma tecla já segurada")
+        m.counter('outputs_dropped_total', "Pressionamentos perdidos por erro no backend")
+        m.counter('outputs_deferred_total', "Saídas normal/low adiadas pelo output_budget")
+        m.gauge('output_queue_max', "Maior profundidade da fila de saída")
+        m.histogram('injection_latency_seconds', "Enfileirado -> press() retornou")
+        m.histogram('priority_inversion_seconds', "Evento -> envio de saídas critical/high")
+        m.counter('sequences_started_total', "Sequências (macros) agendadas")
+        m.counter('sequences_cancelled_total', "Sequências canceladas antes do fim")
+        m.histogram('sequence_timing_error_seconds', "Atraso de cada evento de sequência sobre o instante previsto")
+
+    def schedule_press(self, key_label, now=None, hold_s=None, force_instant=False, priority='normal',
+                       on_dispatch=None):
+        """
+        Enfileira um pressionamento; é enviado no próximo flush(). now = instante do evento.
+        on_dispatch(res), se dado, é chamado quando ele sai da fila com o resultado de
+        _dispatch (True = press enviado, None = só prorrogou, False = backend falhou).
+        """
+        self._seq += 1
+        heapq.heappush(self.queue, (priority_level(priority), self._seq, time.perf_counter(),
+                                    key_label, hold_s, force_instant, now, on_dispatch))
+        self.metrics.set_max('output_queue_max', len(self.queue))
+
+    def schedule_sequence(self, events, now, priority='normal', tag=None):
+        """Agenda [(offset_s, 'press'|'release', tecla), ...] a partir de now."""
+        prio = priority_level(priority)
+        for off, action, key_label in events:
+            self._seq += 1
+            heapq.heappush(self.timed, (now + off, self._seq, action, key_label, tag, prio))
+        self.metrics.inc('sequences_started_total')
+
+    def cancel_sequence(self, tag):
+        """Descarta os eventos pendentes da sequência e solta o que ela segurou."""
+        n = len(self.timed)
+        self.timed = [e for e in self.timed if e[4] != tag]
+        heapq.heapify(self.timed)
+        held = self.timed_keys.pop(tag, {})
+        for k in reversed(held):   # desfaz acordes na ordem inversa
+            try:
+                self.kb.release(k)
+            except Exception:
+                pass
+            self.active_holds.pop(k, None)
+        if held or len(self.timed) != n:
+            self.metrics.inc('sequences_cancelled_total')
+
+    def next_timed(self):
+        """Instante do próximo evento de sequência (ou None)."""
+        return self.timed[0][0] if self.timed else None
+
+    def _dispatch_timed(self, action, key_label, tag, prio):
+        keyobj = self.resolve(key_label)
+        held = self.timed_keys.setdefault(tag, {})
+        try:
+            if action == 'press':
+                if keyobj not in self.active_holds:
+                    self.kb.press(keyobj)
+                    self.metrics.inc(self._sent[prio])
+                self.active_holds[keyobj] = math.inf   # solta só no 'release' da sequência
+                held[keyobj] = None
+            elif keyobj in self.active_holds:
+                self.kb.release(keyobj)
+                self.active_holds.pop(keyobj, None)
+                held.pop(keyobj, None)
+        except Exception:
+            self.metrics.inc('outputs_dropped_total')
+        if not held:
+            self.timed_keys.pop(tag, None)
+
+    def _dispatch(self, now, key_label, hold_s, force_instant):
+        """Envia ao backend: True = press enviado, None = só prorrogou, False = backend falhou."""
+        keyobj = self.resolve(key_label)
+        try:
+            if force_instant:
+                self.kb.press(keyobj)
+                self.kb.release(keyobj)
+                return True
+
+            end_time = now + (hold_s if hold_s is not None else self.default_hold)
+            if keyobj in self.active_holds:
+                # nunca encurta (ex.: tecla segurada por uma sequência)
+                self.active_holds[keyobj] = max(self.active_holds[keyobj], end_time)
+                self.metrics.inc('key_presses_coalesced_total')
+                return None
+            self.kb.press(keyobj)
+            self.active_holds[keyobj] = end_time
+            return True
+        except Exception:
+            self.metrics.inc('outputs_dropped_total')
+            return False
+
+    def flush(self, now):
+        """Envia sequências vencidas, a fila em ordem de prioridade e solta teclas vencidas."""
+        while self.timed and self.timed[0][0] <= now + 1e-9:
+            due, _, action, key_label, tag, prio = heapq.heappop(self.timed)
+            self._dispatch_timed(action, key_label, tag, prio)
+            self.metrics.observe('sequence_timing_error_seconds', max(0.0, now - due))
+
+        sent_low = 0
+        t_flush = time.perf_counter()
+        while self.queue:
+            prio = self.queue[0][0]
+            if prio > PRIO_HIGH and self.budget is not None and sent_low >= self.budget:
+                # o topo já é normal/low, então tudo que sobrou está adiado; cada saída conta uma vez
+                for e in self.queue:
+                    if e[1] not in self._deferred:
+                        self._deferred.add(e[1])
+                        self.metrics.inc('outputs_deferred_total')
+                break
+            prio, seq, t_enq, key_label, hold_s, force_instant, t_event, on_dispatch = heapq.heappop(self.queue)
+            self._deferred.discard(seq)
+            t0 = time.perf_counter()
+            res = self._dispatch(now, key_label, hold_s, force_instant)
+            if on_dispatch is not None:
+                on_dispatch(res)
+            if res is False:
+                continue
+            if res:
+                self.metrics.inc(self._sent[prio])
+            self.metrics.observe('injection_latency_seconds', time.perf_counter() - t_enq)
+
+            if prio <= PRIO_HIGH:
+                # do evento (tick em que o botão foi lido) até o envio: ticks esperando + tempo
+                # gasto neste flush com outras saídas antes dela (inversão de prioridade)
+                waited = max(0.0, now - t_event) if t_event is not None else 0.0
+                self.metrics.observe('priority_inversion_seconds', waited + (t0 - t_flush))
+            else:
+                sent_low += 1
+
+        self.process_releases(now)
+
+    def process_releases(self, now):
+        to_rel = [k for k, t in self.active_holds.items() if now >= t]
+        for k in to_rel:
+            try:
+                self.kb.release(k)
+            except Exception:
+                pass
+            self.active_holds.pop(k, None)
+
+    def release_all(self):
+        """Solta tudo que estiver pressionado (ao encerrar)."""
+        self.timed.clear()
+        self.timed_keys.clear()
+        for k in list(self.active_holds):
+            try:
+                self.kb.release(k)
+            except Exception:
+                pass
+        self.active_holds.clear()
+
+    def format_stats(self):
+        m = self.metrics
+        names = sorted(PRIORITIES, key=PRIORITIES.get)
+        sent = ", ".join(f"{n}={m.counters[c]}" for n, c in zip(names, self._sent))
+        inj = m.histograms['injection_latency_seconds']
+        inv = m.histograms['priority_inversion_seconds']
+        return (f"[SAÍDA] enviados: {sent} | adiados: {m.counters['outputs_deferred_total']} | "
+                f"fila máx: {m.gauges['output_queue_max']} | "
+                f"injeção p99: {inj.quantile(0.99)*1000:.2f} ms | "
+                f"inversão de prioridade (latência alta máx): {inv.max*1000:.2f} ms")
@@ -0,0 +1,47 @@
+# session.py
+"""
+Gravação e replay de sessões de entrada (joystick).
+
+Formato JSONL: a primeira linha é o cabeçalho
+    {"version": 1, "profile": ..., "loop_hz": 120, "start": epoch}
+e cada linha seguinte é uma amostra gravada só quando algo mudou
+    {"t": segundos_desde_o_início, "b": bitmask_botões, "a": [eixos]}
+"""
+import json
+from pathlib import Path
+
+SESSION_VERSION = 1
+
+
+class SessionRecorder:
+    """Grava as amostras do loop (só quando botões ou eixos mudam)."""
+
+    def __init__(self, path, profile=None, loop_hz=120, start=0.0):
+        self.f = open(path, "w", encoding="utf-8")
+        self.start = start
+        self.last = None
+        self.f.write(json.dumps({"version": SESSION_VERSION, "profile": profile,
+                                 "loop_hz": loop_hz, "start": start}) + "\n")
+
+    def write(self, now, mask, axes):
+        sample = (mask, [round(v, 4) for v in axes])
+        if sample != self.last:
+            self.last = sample
+            self.f.write(json.dumps({"t": round(now - self.start, 5), "b": mask, "a": sample[1]}) + "\n")
+
+    def close(self):
+        self.f.close()
+
+
+def load_session(path):
+    """Retorna {"header": dict, "samples": [(t, mask, axes), ...]} ordenado por t."""
+    lines = Path(path).read_text(encoding="utf-8").splitlines()
+    header = json.loads(lines[0]) if lines else {}
+    samples = []
+    for line in lines[1:]:
+        if line.strip():
+            s = json.loads(line)
+            samples.append((float(s["t"]), int(s["b"]), list(s["a"])))
+    samples.sort(key=lambda s: s[0])
+    return {"header": header, "samples": samples}
+
@@ -0,0 +1,101 @@
+# simulate.py
+"""
+Simulação headless e determinística do controlador genérico.
+
+Roda o GenericEngine sobre um SimRuntime (relógio virtual, entradas
+roteirizadas, teclado gravador) o mais rápido possível e imprime a linha do
+tempo de press/release. Com os mesmos (now, botões, eixos) a linha do tempo é
+idêntica à de uma execução em tempo real; sem --no-fast-forward, ticks
+ociosos são pulados até o próximo evento (mesmo resultado, bem mais rápido).
+
+Uso:
+    python simulate.py --profile "X" --script roteiro.json
+    python simulate.py --profile "X" --script sessao.jsonl --json > linha_do_tempo.json
+    python simulate.py --profile "X" --script sessao.jsonl --check   # fast-forward == todos os ticks?
+"""
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from generic_controller import GenericEngine
+from metrics import Metrics
+from runtime import LOOP_HZ, SimRuntime, load_script
+from statefeed import key_label
+
+
+def simulate(cfg, samples, loop_hz=LOOP_HZ, settle=1.0, fast_forward=True, ticks=None):
+    """Roda a simulação; retorna (eventos [(t, ação, rótulo)], motor, runtime)."""
+    rt = SimRuntime(samples, loop_hz, settle=settle)
+    engine = GenericEngine(cfg, rt.kb, Metrics())
+    engine.run(rt, ticks=ticks, fast_forward=fast_forward)
+    engine.out.release_all()
+    events = [(round(t, 6), action, key_label(k)) for t, action, k in rt.kb.events]
+    return events, engine, rt
+
+
+def check_determinism(cfg, samples, loop_hz=LOOP_HZ, settle=1.0):
+    """
+    Roda com e sem fast-forward e compara as linhas do tempo.
+    Retorna None se forem idênticas, senão (índice, evento_ff, evento_todos) da primeira diferença.
+    """
+    ff, _, _ = simulate(cfg, samples, loop_hz, settle, fast_forward=True)
+    full, _, _ = simulate(cfg, samples, loop_hz, settle, fast_forward=False)
+    if ff == full:
+        return None
+    i = next((i for i, (a, b) in enumerate(zip(ff, full)) if a != b), min(len(ff), len(full)))
+    return i, (ff[i] if i < len(ff) else None), (full[i] if i < len(full) else None)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulação headless do controlador genérico")
+    ap.add_argument("--profile", required=True, help="Perfil do profiles.json")
+    ap.add_argument("--script", required=True, metavar="ARQUIVO",
+                    help="Roteiro .json (quadros-chave) ou sessão gravada .jsonl")
+    ap.add_argument("--loop-hz", type=int, default=None,
+                    help=f"Taxa do loop (padrão: sample_rate do perfil ou {LOOP_HZ})")
+    ap.add_argument("--settle", type=float, default=1.0, help="Segundos extras após o roteiro (padrão 1)")
+    ap.add_argument("--ticks", type=int, default=None, help="Limite de ticks")
+    ap.add_argument("--no-fast-forward", action="store_true", help="Processa todos os ticks, mesmo ociosos")
+    ap.add_argument("--json", action="store_true", help="Imprime a linha do tempo em JSON")
+    ap.add_argument("--check", action="store_true",
+                    help="Compara fast-forward com todos os ticks; sai com código 1 se divergirem")
+    args = ap.parse_args()
+
+    profiles = json.loads(Path("profiles.json").read_text(encoding="utf-8"))
+    if args.profile not in profiles:
+        print(f"Perfil '{args.profile}' não encontrado.")
+        return
+
+    samples = load_script(args.script)
+    t0 = time.perf_counter()
+    cfg = profiles[args.profile]
+    loop_hz = args.loop_hz or int(cfg.get("sample_rate", LOOP_HZ))
+    if args.check:
+        diff = check_determinism(cfg, samples, loop_hz, args.settle)
+        if diff is None:
+            print("OK: fast-forward e todos os ticks geram a mesma linha do tempo.")
+            return
+        i, a, b = diff
+        print(f"DIVERGÊNCIA no evento {i}: fast-forward {a} | todos os ticks {b}")
+        sys.exit(1)
+    events, engine, rt = simulate(cfg, samples, loop_hz, args.settle,
+                                  not args.no_fast_forward, args.ticks)
+    wall = time.perf_counter() - t0
+
+    if args.json:
+        print(json.dumps(events))
+        return
+    for t, action, k in events:
+        print(f"{t:9.4f}s  {action:<7} {k}")
+    print(f"\n{rt.n} ticks virtuais ({rt.now():.2f}s simulados) em {wall*1000:.1f} ms "
+          f"→ {rt.n / max(wall * 1000, 1e-9):.0f} ticks/ms")
+    print(engine.out.format_stats())
+
+
+if __name__ == "__main__":
+    main()
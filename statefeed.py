@@ -0,0 +1,204 @@
+# statefeed.py
+"""
+Feed do estado ao vivo em memória compartilhada (layout fixo, sem IPC).
+
+O controlador publica a cada tick: eixos brutos, etapa/seção quantizada por
+eixo, bitmask de botões, profundidade da fila de taps e teclas seguradas.
+Overlays, loggers e testes leem na taxa que quiserem com StateFeedReader.
+
+Consistência por seqlock: o escritor deixa 'seq' ímpar durante a escrita e
+par ao terminar; o leitor copia o bloco e só aceita se 'seq' for par e igual
+antes e depois da cópia.
+
+Layout (little-endian, versão 1):
+    cabeçalho  magic '4s' | version H | max_axes H | max_held H | pad H | 4x | seq Q
+    estado     timestamp d | tick Q | buttons 2Q (128 botões) | n_axes H
+               n_held H | step_queue I | out_queue I
+    eixos      max_axes x (raw f | step h | bucket h)      (-1 = não se aplica)
+    teclas     max_held x 16s (rótulo utf-8)
+"""
+import argparse
+import struct
+import time
+from multiprocessing import shared_memory
+
+MAGIC = b'ARSF'
+VERSION = 1
+MAX_AXES = 16
+MAX_HELD = 16
+MAX_BUTTONS = 128
+DEFAULT_NAME = 'ardurail_state'
+
+_HEADER = struct.Struct('<4sHHHH4xQ')  # seq alinhado em 8 bytes
+_SEQ = struct.Struct('<Q')
+_SEQ_OFFSET = _HEADER.size - _SEQ.size
+_STATE = struct.Struct('<dQQQHHII')
+_AXES = struct.Struct('<' + 'fhh' * MAX_AXES)
+_HELD = struct.Struct('<' + '16s' * MAX_HELD)
+_PAYLOAD_OFFSET = _HEADER.size
+SIZE = _HEADER.size + _STATE.size + _AXES.size + _HELD.size
+
+_NO_VALUE = [-1] * MAX_AXES
+
+_OWNED = set()   # blocos criados por um StateFeed deste processo
+
+
+def _attach(name):
+    """Abre um bloco existente sem registrá-lo no resource_tracker (não é nosso)."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _OWNED:
+            # abrir registra o nome; se o escritor está neste processo o registro é dele
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+        return shm
+
+
+def key_label(k):
+    """Rótulo curto de uma tecla pynput (Key.down -> 'down')."""
+    return getattr(k, 'name', None) or str(k)
+
+
+class StateFeed:
+    """Escritor do feed (um por controlador)."""
+
+    def __init__(self, name=DEFAULT_NAME):
+        self.name = name
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+        except FileExistsError:
+            # sobra de uma execução anterior que não encerrou direito
+            # (abre registrado: o unlink() abaixo desfaz o registro)
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            try:
+                old.unlink()
+            except Exception:
+                pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+        _OWNED.add(name)
+        self.buf = self.shm.buf
+        self.seq = 0
+        self.tick = 0
+        _HEADER.pack_into(self.buf, 0, MAGIC, VERSION, MAX_AXES, MAX_HELD, 0, 0)
+
+    def publish(self, now, mask, axes, steps=None, buckets=None, step_queue=0, out_queue=0, held=()):
+        """
+        Publica uma amostra.
+        - steps/buckets: listas por índice de eixo (-1 = eixo sem esse mapeamento)
+        - held: rótulos das teclas atualmente seguradas
+        """
+        buf = self.buf
+        self.tick += 1
+        self.seq += 1
+        _SEQ.pack_into(buf, _SEQ_OFFSET, self.seq)  # ímpar: escrevendo
+
+        n_axes = min(len(axes), MAX_AXES)
+        held = list(held)[:MAX_HELD]
+        steps = steps or _NO_VALUE
+        buckets = buckets or _NO_VALUE
+        off = _PAYLOAD_OFFSET
+        _STATE.pack_into(buf, off, now, self.tick,
+                         mask & 0xFFFFFFFFFFFFFFFF, (mask >> 64) & 0xFFFFFFFFFFFFFFFF,
+                         n_axes, len(held), step_queue, out_queue)
+        off += _STATE.size
+        flat = []
+        for a in range(MAX_AXES):
+            if a < n_axes:
+                flat += (axes[a], steps[a] if a < len(steps) else -1, buckets[a] if a < len(buckets) else -1)
+            else:
+                flat += (0.0, -1, -1)
+        _AXES.pack_into(buf, off, *flat)
+        off += _AXES.size
+        _HELD.pack_into(buf, off, *([h.encode('utf-8')[:16] for h in held] + [b''] * (MAX_HELD - len(held))))
+
+        self.seq += 1
+        _SEQ.pack_into(buf, _SEQ_OFFSET, self.seq)  # par: consistente
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except Exception:
+            pass
+        _OWNED.discard(self.name)
+
+
+class StateFeedReader:
+    """Leitor do feed; read() retorna um dict consistente ou None se não houver dados."""
+
+    def __init__(self, name=DEFAULT_NAME):
+        self.shm = _attach(name)
+        magic, version, max_axes, max_held, _, _ = _HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != VERSION or max_axes != MAX_AXES or max_held != MAX_HELD:
+            self.shm.close()
+            raise RuntimeError(f"Feed '{name}' com layout incompatível (versão {version}).")
+
+    def read(self, retries=1000):
+        buf = self.shm.buf
+        for _ in range(retries):
+            s1, = _SEQ.unpack_from(buf, _SEQ_OFFSET)
+            if s1 & 1:
+                continue
+            data = bytes(buf[_PAYLOAD_OFFSET:SIZE])
+            s2, = _SEQ.unpack_from(buf, _SEQ_OFFSET)
+            if s1 == s2:
+                break
+        else:
+            return None
+        if s1 == 0:
+            return None
+
+        now, tick, lo, hi, n_axes, n_held, step_queue, out_queue = _STATE.unpack_from(data, 0)
+        flat = _AXES.unpack_from(data, _STATE.size)
+        held = _HELD.unpack_from(data, _STATE.size + _AXES.size)
+        return {
+            'seq': s1,
+            'time': now,
+            'tick': tick,
+            'buttons': lo | (hi << 64),
+            'axes': list(flat[0:3 * n_axes:3]),
+            'steps': list(flat[1:3 * n_axes:3]),
+            'buckets': list(flat[2:3 * n_axes:3]),
+            'step_queue': step_queue,
+            'out_queue': out_queue,
+            'held': [h.rstrip(b'\0').decode('utf-8', 'replace') for h in held[:n_held]],
+        }
+
+    def close(self):
+        self.shm.close()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Lê o feed de estado do controlador (memória compartilhada)")
+    p.add_argument("--name", default=DEFAULT_NAME, help=f"Nome do bloco (padrão {DEFAULT_NAME})")
+    p.add_argument("--rate", type=float, default=10.0, help="Leituras por segundo (padrão 10)")
+    args = p.parse_args()
+
+    try:
+        r = StateFeedReader(args.name)
+    except FileNotFoundError:
+        print(f"Feed '{args.name}' não encontrado. O controlador está rodando com --shm?")
+        return
+    try:
+        while True:
+            st = r.read()
+            if st:
+                axes = " ".join(f"E{a}:{v:+.3f}" for a, v in enumerate(st['axes']))
+                print(f"#{st['tick']} botões={st['buttons']:#x} {axes} "
+                      f"etapas={st['steps']} fila={st['step_queue']} teclas={st['held']}")
+            time.sleep(1.0 / args.rate)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        r.close()
+
+
+if __name__ == "__main__":
+    main()
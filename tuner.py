@@ -0,0 +1,282 @@
+# tuner.py
+"""
+Ajuste de parâmetros por varredura (grid) sobre sessões gravadas.
+
+Cada combinação de parâmetros é aplicada ao perfil e as sessões são
+reproduzidas no GenericEngine com relógio virtual (sem joystick, sem
+teclado, sem esperar tempo real), em paralelo num pool de processos.
+
+Cada combinação recebe uma pontuação (menor = melhor) a partir de:
+- time_to_target: tempo médio até o notch do jogo igualar a alavanca
+- keystrokes:     total de teclas enviadas
+- spurious:       mudanças de etapa desfeitas em menos de SPURIOUS_WINDOW
+- queue_peak:     pico da fila de taps + fila de saída
+- final_error:    notches de diferença no fim (taps perdidos/fundidos)
+- tracking_error: integral de |jogo - alavanca| no tempo (notch·s)
+- overshoot:      maior avanço do jogo além da alavanca, no sentido em que o
+                  próprio jogo andou (modo preditivo; jogo atrasado não conta)
+
+Uso:
+    python generic_controller.py --profile "X" --record sessao1.jsonl
+    python tuner.py --profile "X" --session sessao1.jsonl \\
+        --grid tap_hold=0.03,0.04 --grid tap_interval=0.05,0.06 --grid hysteresis=0,0.2
+"""
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import copy
+import itertools
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from backends import axis_value
+from generic_controller import GenericEngine, axis_to_step, resolve_key
+from metrics import Metrics
+from runtime import LOOP_HZ, SimRuntime
+from session import load_session
+
+PROFILES_PATH = Path("profiles.json")
+
+# parâmetros do perfil (nível raiz) e dos eixos
+PROFILE_KEYS = {"press_hold_seconds", "button_hold_repeat_hold", "repeat_delay", "repeat_interval", "output_budget",
+                "sample_rate"}
+STEP_KEYS = {"tap_hold", "tap_interval", "hysteresis",
+             "predict", "predict_horizon", "predict_window", "predict_max_overshoot", "predict_min_speed",
+             "resync", "resync_burst"}
+SECTION_KEYS = {"hysteresis"}
+
+DEFAULT_GRID = {
+    "tap_hold": [0.02, 0.03, 0.04, 0.06],
+    "tap_interval": [0.04, 0.05, 0.06, 0.08],
+    "hysteresis": [0.0, 0.1, 0.2, 0.3],
+}
+
+SETTLE_SECONDS = 2.0      # tempo extra após a sessão para a fila esvaziar
+SPURIOUS_WINDOW = 0.15    # mudança desfeita dentro disso conta como espúria
+WEIGHTS = {
+    "time_to_target": 10.0,   # por segundo
+    "keystrokes": 0.01,       # por tecla
+    "spurious": 0.5,          # por transição
+    "queue_peak": 0.05,       # por item
+    "final_error": 5.0,       # por notch
+    "tracking_error": 2.0,    # por notch·s
+    "overshoot": 1.0,         # por notch
+}
+
+
+def parse_grid(items):
+    """['tap_hold=0.03,0.04', ...] -> {'tap_hold': [0.03, 0.04], ...}"""
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        if not values:
+            raise SystemExit(f"--grid inválido: '{item}' (use nome=v1,v2,...)")
+        grid[name.strip()] = [float(v) for v in values.split(",") if v.strip()]
+    return grid
+
+
+def apply_params(cfg, params):
+    """
+    Cópia do perfil com os parâmetros aplicados:
+    - chaves do perfil (press_hold_seconds, output_budget, ...) na raiz
+    - tap_hold/tap_interval/hysteresis em todos os eixos onde se aplicam
+    - 'axes.<n>.<chave>' só no eixo n
+    """
+    cfg = copy.deepcopy(cfg)
+    for name, v in params.items():
+        parts = name.split(".")
+        if len(parts) == 3 and parts[0] == "axes":
+            cfg["axes"][parts[1]][parts[2]] = v
+        elif name in PROFILE_KEYS:
+            cfg[name] = int(v) if name in ("output_budget", "sample_rate") else v
+        elif name in STEP_KEYS:
+            for ac in cfg.get("axes", {}).values():
+                if ac["type"] == "steps_to_buttons" or (ac["type"] == "sections_to_keys" and name in SECTION_KEYS):
+                    ac[name] = v
+        else:
+            raise ValueError(f"Parâmetro desconhecido: '{name}'")
+    return cfg
+
+
+def replay_session(cfg, session, loop_hz=LOOP_HZ):
+    """Reproduz uma sessão no motor com relógio virtual e mede o resultado."""
+    rt = SimRuntime(session["samples"], loop_hz, settle=SETTLE_SECONDS)
+    kb = rt.kb
+    metrics = Metrics()
+    engine = GenericEngine(cfg, kb, metrics)
+
+    step_axes = {a: ac for a, ac in engine.axes_cfg.items() if ac["type"] == "steps_to_buttons"}
+    key_axes = {}   # tecla resolvida -> [(eixo, +1/-1)]
+    for a, ac in step_axes.items():
+        key_axes.setdefault(resolve_key(ac.get("key_pos", "down")), []).append((a, 1))
+        key_axes.setdefault(resolve_key(ac.get("key_neg", "up")), []).append((a, -1))
+
+    game = {}             # notch que o jogo vê (conta só presses reais)
+    lever = {}
+    pending_since = {}    # eixo -> t em que jogo e alavanca divergiram
+    latencies = []
+    engine_step = {}      # eixo -> (etapa, t_mudança, etapa_anterior)
+    spurious = 0
+    n_ev = 0
+    tracking = 0.0
+    overshoot = 0
+    last_t = None
+    past = {}             # eixo -> sentido em que um press do jogo cruzou a alavanca (+1/-1)
+
+    def on_tick(t, mask, axes):
+        nonlocal n_ev, spurious, tracking, overshoot, last_t
+        # o erro vale desde o último tick processado (ticks pulados não mudam nada)
+        if last_t is not None:
+            tracking += (t - last_t) * sum(abs(game[a] - lever[a]) for a in step_axes)
+        last_t = t
+        for a, ac in step_axes.items():
+            s = axis_to_step(axis_value(axes, a), int(ac.get("steps", 10)), bool(ac.get("invert", False)))
+            lever[a] = s
+            game.setdefault(a, s)
+
+        for _, action, k in kb.events[n_ev:]:
+            if action == "press":
+                for a, d in key_axes.get(k, ()):
+                    prev = game[a]
+                    game[a] = max(0, min(int(step_axes[a].get("steps", 10)), prev + d))
+                    # overshoot só quando o próprio jogo passa da alavanca (não quando ela volta
+                    # para trás de um jogo atrasado) e enquanto continua no mesmo sentido
+                    if (prev - lever[a]) * d <= 0 < (game[a] - lever[a]) * d:
+                        past[a] = d
+                    if past.get(a) == d:
+                        overshoot = max(overshoot, (game[a] - lever[a]) * d)
+        n_ev = len(kb.events)
+
+        for a in step_axes:
+            if past.get(a) and (game[a] - lever[a]) * past[a] <= 0:
+                past.pop(a)   # voltou (ou a alavanca alcançou): fim do overshoot
+            if game[a] != lever[a]:
+                pending_since.setdefault(a, t)
+            elif a in pending_since:
+                latencies.append(t - pending_since.pop(a))
+
+            cur = engine.axis_state[a]["last_step"]
+            prev = engine_step.get(a)
+            if prev is None:
+                engine_step[a] = (cur, t, cur)
+            elif cur != prev[0]:
+                if cur == prev[2] and t - prev[1] <= SPURIOUS_WINDOW:
+                    spurious += 1
+                engine_step[a] = (cur, t, prev[0])
+
+    engine.run(rt, on_tick=on_tick, fast_forward=True)
+    t = rt.now()
+
+    unreached = 0
+    for a, since in pending_since.items():
+        latencies.append(t - since)
+        unreached += 1
+
+    return {
+        "latencies": latencies,
+        "unreached": unreached,
+        "keystrokes": sum(1 for e in kb.events if e[1] == "press"),
+        "spurious": spurious,
+        "queue_peak": metrics.gauges["step_queue_max"] + metrics.gauges["output_queue_max"],
+        "final_error": sum(abs(game[a] - lever[a]) for a in step_axes) if step_axes else 0,
+        "tracking_error": tracking,
+        "overshoot": overshoot,
+    }
+
+
+def score(result):
+    return sum(WEIGHTS[k] * result[k] for k in WEIGHTS)
+
+
+# ---------- pool de processos ----------
+_SESSIONS = []
+
+
+def _init_worker(paths):
+    global _SESSIONS
+    _SESSIONS = [load_session(p) for p in paths]
+
+
+def evaluate(job):
+    """Avalia uma combinação em todas as sessões (roda no processo do pool)."""
+    base_cfg, params = job
+    cfg = apply_params(base_cfg, params)
+    latencies = []
+    total = {"keystrokes": 0, "spurious": 0, "queue_peak": 0, "final_error": 0, "unreached": 0,
+             "tracking_error": 0.0, "overshoot": 0}
+    for s in _SESSIONS:
+        # taxa do perfil (sample_rate) se houver; senão a da gravação
+        r = replay_session(cfg, s, int(cfg.get("sample_rate") or s["header"].get("loop_hz", LOOP_HZ)))
+        latencies += r["latencies"]
+        total["keystrokes"] += r["keystrokes"]
+        total["spurious"] += r["spurious"]
+        total["final_error"] += r["final_error"]
+        total["unreached"] += r["unreached"]
+        total["tracking_error"] += r["tracking_error"]
+        total["overshoot"] = max(total["overshoot"], r["overshoot"])
+        total["queue_peak"] = max(total["queue_peak"], r["queue_peak"])
+    latencies.sort()
+    total["time_to_target"] = sum(latencies) / len(latencies) if latencies else 0.0
+    total["time_to_target_p95"] = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+    total["score"] = score(total)
+    return params, total
+
+
+def tune(base_cfg, session_paths, grid, workers=None):
+    """Roda a grade inteira; retorna [(params, resultado)] do melhor para o pior."""
+    names = list(grid)
+    jobs = [(base_cfg, dict(zip(names, combo))) for combo in itertools.product(*(grid[n] for n in names))]
+    for _, params in jobs[:1]:
+        apply_params(base_cfg, params)   # valida nomes antes de subir o pool
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             initializer=_init_worker, initargs=(list(session_paths),)) as ex:
+        results = list(ex.map(evaluate, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1)))))
+    results.sort(key=lambda r: r[1]["score"])
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Varredura de parâmetros sobre sessões gravadas")
+    ap.add_argument("--profile", required=True, help="Perfil base do profiles.json")
+    ap.add_argument("--session", action="append", required=True, metavar="ARQUIVO",
+                    help="Sessão gravada com generic_controller.py --record (pode repetir)")
+    ap.add_argument("--grid", action="append", default=[], metavar="NOME=V1,V2",
+                    help="Valores a testar (pode repetir). Padrão: tap_hold, tap_interval, hysteresis")
+    ap.add_argument("--workers", type=int, default=None, help="Processos (padrão: todos os núcleos)")
+    ap.add_argument("--top", type=int, default=5, help="Quantas combinações mostrar")
+    ap.add_argument("--save-as", default=None, metavar="NOME",
+                    help="Nome do perfil candidato (padrão: '<perfil> (candidato)')")
+    ap.add_argument("--no-save", action="store_true", help="Não grava o candidato no profiles.json")
+    args = ap.parse_args()
+
+    profiles = json.loads(PROFILES_PATH.read_text(encoding="utf-8"))
+    if args.profile not in profiles:
+        print(f"Perfil '{args.profile}' não encontrado.")
+        return
+    base = profiles[args.profile]
+    grid = parse_grid(args.grid) if args.grid else DEFAULT_GRID
+    n = math.prod(len(v) for v in grid.values())
+    print(f"Perfil: {args.profile} | sessões: {len(args.session)} | combinações: {n}")
+
+    results = tune(base, args.session, grid, args.workers)
+
+    for i, (params, r) in enumerate(results[:args.top], start=1):
+        p = ", ".join(f"{k}={v:g}" for k, v in params.items())
+        print(f"{i}. score={r['score']:.3f} | {p} | alvo {r['time_to_target']*1000:.0f} ms "
+              f"(p95 {r['time_to_target_p95']*1000:.0f} ms) | teclas {r['keystrokes']} | "
+              f"espúrias {r['spurious']} | fila {r['queue_peak']} | erro final {r['final_error']} | "
+              f"rastreio {r['tracking_error']:.2f} notch·s | overshoot {r['overshoot']}")
+
+    best_params, best = results[0]
+    if not args.no_save:
+        name = args.save_as or f"{args.profile} (candidato)"
+        profiles[name] = apply_params(base, best_params)
+        PROFILES_PATH.write_text(json.dumps(profiles, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"✓ Perfil candidato '{name}' salvo no {PROFILES_PATH}.")
+
+
+if __name__ == "__main__":
+    main()